@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalculate user reputation statistics from the raw like and show rows'
+
+    def handle(self, *args, **options):
+        users = rebuild_user_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {users} users'))
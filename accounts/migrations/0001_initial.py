@@ -0,0 +1,60 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:54
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserStats = apps.get_model('accounts', 'UserStats')
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    PostShow = apps.get_model('pyflow', 'PostShow')
+    CommentLike = apps.get_model('pyflow', 'CommentLike')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in User.objects.values_list('pk', flat=True)],
+        batch_size=500,
+    )
+    UserStats.objects.update(
+        posts_likes=aggregate(PostLike, 'post__user', Sum('value')),
+        posts_shows=aggregate(PostShow, 'post__user', Count('id')),
+        comments_likes=aggregate(CommentLike, 'comment__user', Sum('value')),
+    )
+    UserStats.objects.update(reputation=F('posts_likes') + F('posts_shows') + F('comments_likes'))
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('pyflow', '0017_post_hot_score_score_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auth.user')),
+                ('posts_likes', models.IntegerField(default=0)),
+                ('posts_shows', models.PositiveIntegerField(default=0)),
+                ('comments_likes', models.IntegerField(default=0)),
+                ('reputation', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['reputation', 'user'], name='user_stats_reputation_idx'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-18 18:20
+
+from django.db import migrations
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def recount_votes(apps, schema_editor):
+    # Duplicate votes were dropped by pyflow 0021.
+    UserStats = apps.get_model('accounts', 'UserStats')
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    CommentLike = apps.get_model('pyflow', 'CommentLike')
+    UserStats.objects.update(
+        posts_likes=aggregate(PostLike, 'post__user', Sum('value')),
+        comments_likes=aggregate(CommentLike, 'comment__user', Sum('value')),
+    )
+    UserStats.objects.update(reputation=F('posts_likes') + F('posts_shows') + F('comments_likes'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('pyflow', '0021_unique_votes'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_votes, migrations.RunPython.noop),
+    ]
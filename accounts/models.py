@@ -1,3 +1,23 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats',
+    )
+    posts_likes = models.IntegerField(default=0)
+    posts_shows = models.PositiveIntegerField(default=0)
+    comments_likes = models.IntegerField(default=0)
+    reputation = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reputation', 'user'], name='user_stats_reputation_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} reputation: {self.reputation}'
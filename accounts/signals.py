@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.stats import bump_user_stats, release_user_stats
+from pyflow.models import Comment, CommentLike, Post, PostLike, PostShow
+
+
+@receiver(post_save, sender=PostLike)
+def count_post_vote(sender, instance, **kwargs):
+    if instance.delta and instance.post_id:
+        bump_user_stats(instance.post.user_id, posts_likes=instance.delta)
+
+
+@receiver(post_save, sender=PostShow)
+def count_post_show(sender, instance, created, **kwargs):
+    if created and instance.post_id:
+        bump_user_stats(instance.post.user_id, posts_shows=1)
+
+
+@receiver(post_save, sender=CommentLike)
+def count_comment_vote(sender, instance, **kwargs):
+    if instance.delta and instance.comment_id:
+        bump_user_stats(instance.comment.user_id, comments_likes=instance.delta)
+
+
+# Votes release their own totals as they are deleted, including when their
+# post, comment or voter is, so a deleted post only gives up its shows.
+@receiver(pre_delete, sender=Post)
+def release_post_stats(sender, instance, **kwargs):
+    counters = Post.objects.filter(pk=instance.pk).values('user_id', 'show_count').first()
+    if counters:
+        release_user_stats(counters['user_id'], posts_shows=-counters['show_count'])
+
+
+@receiver(pre_delete, sender=PostLike)
+def release_post_vote_stats(sender, instance, **kwargs):
+    if instance.value and instance.post_id:
+        owner_id = Post.objects.filter(pk=instance.post_id).values_list('user_id', flat=True).first()
+        release_user_stats(owner_id, posts_likes=-instance.value)
+
+
+@receiver(pre_delete, sender=CommentLike)
+def release_comment_vote_stats(sender, instance, **kwargs):
+    if instance.value and instance.comment_id:
+        owner_id = Comment.objects.filter(pk=instance.comment_id).values_list('user_id', flat=True).first()
+        release_user_stats(owner_id, comments_likes=-instance.value)
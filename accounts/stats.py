@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import UserStats
+from pyflow.models import CommentLike, PostLike, PostShow, PostShowDaily
+
+STAT_FIELDS = ('posts_likes', 'posts_shows', 'comments_likes')
+
+
+def bump_user_stats(user_id, **deltas):
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    changes['reputation'] = F('reputation') + sum(deltas.values())
+    with transaction.atomic():
+        if UserStats.objects.filter(user_id=user_id).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                UserStats.objects.create(user_id=user_id, reputation=sum(deltas.values()), **deltas)
+        except IntegrityError:
+            UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def release_user_stats(user_id, **deltas):
+    # Only an existing row is updated: one that is missing never counted
+    # what is being released.
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    changes['reputation'] = F('reputation') + sum(deltas.values())
+    UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def _aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def rebuild_user_stats():
+    with transaction.atomic():
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in User.objects.filter(stats__isnull=True).values_list('pk', flat=True)],
+            batch_size=500,
+        )
+        # UserStats shares its primary key with User, so the aggregates
+        # correlate on the stats row directly.
+        UserStats.objects.update(
+            posts_likes=_aggregate(PostLike, 'post__user', Sum('value')),
+            posts_shows=(
+                _aggregate(PostShowDaily, 'post__user', Sum('shows')) + _aggregate(PostShow, 'post__user', Count('id'))
+            ),
+            comments_likes=_aggregate(CommentLike, 'comment__user', Sum('value')),
+        )
+        return UserStats.objects.update(reputation=F('posts_likes') + F('posts_shows') + F('comments_likes'))
@@ -1,12 +1,19 @@
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.db.models import QuerySet
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from accounts.models import UserStats
 from pyflow.models import Tag, Post, PostLike, PostShow, Comment, CommentLike
+from pyflow.show_buffer import show_buffer
 
 
 class ViewTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.user_1 = User.objects.create_user(username='user1')
         self.user_2 = User.objects.create_user(username='user2')
         self.tag_1 = Tag.objects.create(title='tag1')
@@ -88,3 +95,78 @@ class ViewTestCase(TestCase):
         self.assertIsInstance(comments_likes, int)
         self.assertEqual(comments_likes, 1)
 
+
+class UserStatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        show_buffer.clear()
+        self.user_1 = User.objects.create_user(username='user1')
+        self.user_2 = User.objects.create_user(username='user2')
+        self.user_3 = User.objects.create_user(username='user3')
+        self.post_1 = Post.objects.create(title='title1', content='content1', user=self.user_1)
+        self.post_2 = Post.objects.create(title='title2', content='content2', user=self.user_2)
+        PostLike.objects.create(value=1, post=self.post_1, user=self.user_2)
+        PostLike.objects.create(value=1, post=self.post_1, user=self.user_3)
+        PostLike.objects.create(value=-1, post=self.post_2, user=self.user_1)
+        PostShow.objects.create(post=self.post_1, user=self.user_2)
+        self.comment = Comment.objects.create(comment='comment', post=self.post_2, user=self.user_1)
+        CommentLike.objects.create(value=1, comment=self.comment, user=self.user_2)
+        CommentLike.objects.create(value=1, comment=self.comment, user=self.user_3)
+
+    def stats(self, user):
+        return UserStats.objects.values('posts_likes', 'posts_shows', 'comments_likes', 'reputation').get(user=user)
+
+    def test_votes_shows_and_comment_votes(self):
+        self.assertEqual(
+            self.stats(self.user_1),
+            {'posts_likes': 2, 'posts_shows': 1, 'comments_likes': 2, 'reputation': 5},
+        )
+        self.assertEqual(
+            self.stats(self.user_2),
+            {'posts_likes': -1, 'posts_shows': 0, 'comments_likes': 0, 'reputation': -1},
+        )
+        self.assertFalse(UserStats.objects.filter(user=self.user_3).exists())
+
+    def test_buffered_shows(self):
+        show_buffer.add(self.post_1.pk, self.user_3.pk)
+        show_buffer.add(self.post_2.pk, self.user_3.pk)
+        show_buffer.add(self.post_2.pk, self.user_1.pk)
+        show_buffer.flush()
+        self.assertEqual(self.stats(self.user_1)['posts_shows'], 2)
+        self.assertEqual(self.stats(self.user_1)['reputation'], 6)
+        self.assertEqual(self.stats(self.user_2)['posts_shows'], 2)
+
+    def test_deletes_release_stats(self):
+        self.comment.delete()
+        self.assertEqual(self.stats(self.user_1)['comments_likes'], 0)
+        self.assertEqual(self.stats(self.user_1)['reputation'], 3)
+        Comment.objects.create(comment='comment', post=self.post_2, user=self.user_3)
+        CommentLike.objects.create(value=1, comment=self.post_2.comments.get(), user=self.user_1)
+        self.post_2.delete()
+        self.assertEqual(self.stats(self.user_2)['reputation'], 0)
+        self.assertEqual(self.stats(self.user_3)['reputation'], 0)
+
+    def test_rebuild_user_stats(self):
+        expected = [self.stats(user) for user in (self.user_1, self.user_2)]
+        UserStats.objects.update(posts_likes=100, reputation=100)
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertEqual([self.stats(user) for user in (self.user_1, self.user_2)], expected)
+        self.assertEqual(
+            self.stats(self.user_3),
+            {'posts_likes': 0, 'posts_shows': 0, 'comments_likes': 0, 'reputation': 0},
+        )
+
+    def test_profile_without_stats(self):
+        self.client.force_login(self.user_3)
+        response = self.client.get('/accounts/profile/')
+        self.assertEqual(response.context['reputation'], 0)
+
+    @override_settings(PYFLOW_PAGE_SIZE=1)
+    def test_view_top_users(self):
+        response = self.client.get('/accounts/top/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'top_users.html')
+        self.assertEqual([stats.user for stats in response.context['users_stats']], [self.user_1])
+        response = self.client.get('/accounts/top/' + response.context['page'].next_url)
+        self.assertEqual([stats.user for stats in response.context['users_stats']], [self.user_2])
+        self.assertFalse(response.context['page'].has_next())
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import SignUpView, view_user_profile
+from .views import SignUpView, view_user_profile, view_top_users
 
 urlpatterns = [
     path('signup/', SignUpView.as_view(), name='signup'),
     path('profile/', view_user_profile, name='profile'),
+    path('top/', view_top_users, name='top-users'),
 ]
@@ -1,10 +1,14 @@
 from django.contrib.auth.forms import UserCreationForm
-from django.db.models import Count, F, Sum
+from django.db.models import Count, F
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views import generic
 
+from accounts.models import UserStats
 from pyflow.models import Post, Comment, Tag
+from pyflow.pagination import paginate
+
+TOP_USERS_ORDERING = ('-reputation', '-user_id')
 
 
 class SignUpView(generic.CreateView):
@@ -19,12 +23,7 @@ def view_user_profile(request):
         posts = Post.objects.filter(user=user).order_by('-create_at')
         comments = Comment.objects.filter(user=user)
         tags = Tag.objects.filter(posts__user=user).annotate(posts_count=Count(F('posts'))).order_by('-posts_count')
-        posts_likes = posts.aggregate(likes=Sum(F('likes__value')))['likes']
-        posts_likes = posts_likes if posts_likes else 0
-        posts_shows = posts.aggregate(count=Count(F('shows')))['count']
-        posts_shows = posts_shows if posts_shows else 0
-        comments_likes = comments.aggregate(likes=Sum(F('likes__value')))['likes']
-        comments_likes = comments_likes if comments_likes else 0
+        stats = UserStats.objects.filter(user=user).first() or UserStats(user=user)
         posts_commented_by_user = Post.objects.filter(
             comments__user=user).annotate(post_count=Count(F('id'))).order_by('-post_count')
         context = {
@@ -32,11 +31,20 @@ def view_user_profile(request):
             'posts': posts,
             'comments': comments,
             'tags': tags,
-            'reputation': sum([posts_likes, posts_shows, comments_likes]),
-            'posts_shows': posts_shows,
-            'posts_likes': posts_likes,
-            'comments_likes': comments_likes,
+            'reputation': stats.reputation,
+            'posts_shows': stats.posts_shows,
+            'posts_likes': stats.posts_likes,
+            'comments_likes': stats.comments_likes,
             'posts_commented_by_user': posts_commented_by_user,
         }
         return render(request, 'profile.html', context)
     return redirect('login')
+
+
+def view_top_users(request):
+    page = paginate(request, UserStats.objects.select_related('user'), TOP_USERS_ORDERING)
+    context = {
+        'users_stats': page.object_list,
+        'page': page,
+    }
+    return render(request, 'top_users.html', context)
@@ -0,0 +1,249 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+
+from pyflow import views
+from pyflow.models import Comment, Post, Tag
+from pyflow.pagination import InvalidCursor, KeysetPaginator, ordered_by_ids
+from pyflow.series import post_series, trending_posts
+from pyflow.tags_creator import tag_index
+
+# Output name -> what to select for it. A string is a column returned under
+# its own name, a dict is a nested object built from several columns, an
+# expression is annotated under the output name, and None is loaded by the
+# view with a query of its own.
+POST_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'content': 'content',
+    'content_code': 'content_code',
+    'create_at': 'create_at',
+    'rating': 'rating',
+    'show_count': 'show_count',
+    'comment_count': 'comment_count',
+    'user': {'id': 'user_id', 'username': 'user__username'},
+    'tags': None,
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'comment': 'comment',
+    'create_at': 'create_at',
+    'rating': 'rating',
+    'post_id': 'post_id',
+    'user': {'id': 'user_id', 'username': 'user__username'},
+}
+TAG_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'post_count': 'post_count',
+}
+USER_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'date_joined': 'date_joined',
+    'reputation': Coalesce('stats__reputation', Value(0)),
+    'posts_likes': Coalesce('stats__posts_likes', Value(0)),
+    'posts_shows': Coalesce('stats__posts_shows', Value(0)),
+    'comments_likes': Coalesce('stats__comments_likes', Value(0)),
+}
+
+POST_ORDERINGS = {
+    'new': views.FEED_ORDERING,
+    'top': views.TOP_ORDERING,
+    'hot': views.HOT_ORDERING,
+}
+COMMENT_ORDERING = ('create_at', 'id')
+TAG_ORDERING = ('-post_count', '-id')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_view(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse({'error': 'Method not allowed'}, status=405)
+        try:
+            return JsonResponse(view(request, *args, **kwargs))
+        except ApiError as error:
+            return JsonResponse({'error': error.message}, status=error.status)
+    return wrapper
+
+
+def requested_fields(request, spec):
+    value = request.GET.get('fields')
+    if not value:
+        return list(spec)
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in spec]
+    if unknown or not names:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}; expected any of: {", ".join(spec)}')
+    return names
+
+
+def select(queryset, spec, names):
+    # Only the columns behind the requested fields are selected; the primary
+    # key always is, since loaders and the paginator key on it.
+    columns, expressions = ['id'], {}
+    for name in names:
+        source = spec[name]
+        if isinstance(source, str):
+            columns.append(source)
+        elif isinstance(source, dict):
+            columns.extend(source.values())
+        elif source is not None:
+            expressions[name] = source
+    return queryset.values(*dict.fromkeys(columns), **expressions)
+
+
+def serialize(row, spec, names):
+    data = {}
+    for name in names:
+        source = spec[name]
+        if isinstance(source, str):
+            data[name] = row[source]
+        elif isinstance(source, dict):
+            nested = {key: row[column] for key, column in source.items()}
+            data[name] = nested if nested['id'] is not None else None
+        elif source is not None:
+            data[name] = row[name]
+    return data
+
+
+def limit(request):
+    try:
+        value = int(request.GET.get('limit', settings.PYFLOW_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    if not 1 <= value <= settings.PYFLOW_API_MAX_LIMIT:
+        raise ApiError(f'limit must be between 1 and {settings.PYFLOW_API_MAX_LIMIT}')
+    return value
+
+
+def keyset_page(request, queryset, ordering):
+    paginator = KeysetPaginator(queryset, ordering, per_page=limit(request))
+    try:
+        return paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        raise ApiError('Invalid page cursor')
+
+
+def listing(page, rows):
+    return {'results': rows, 'next': page.next_cursor, 'previous': page.prev_cursor}
+
+
+def post_rows(queryset, names):
+    rows = list(select(queryset, POST_FIELDS, names))
+    posts = [serialize(row, POST_FIELDS, names) for row in rows]
+    if 'tags' in names:
+        tags = {row['id']: [] for row in rows}
+        postings = Post.tags.through.objects.filter(post_id__in=list(tags)).order_by('tag_id')
+        for post_id, tag_id, title in postings.values_list('post_id', 'tag_id', 'tag__title'):
+            tags[post_id].append({'id': tag_id, 'title': title})
+        for row, post in zip(rows, posts):
+            post['tags'] = tags[row['id']]
+    return posts
+
+
+def parse_ids(value):
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+    except ValueError:
+        raise ApiError('ids must be a comma separated list of integers')
+    if not ids:
+        raise ApiError('ids must not be empty')
+    if len(ids) > settings.PYFLOW_API_MAX_IDS:
+        raise ApiError(f'At most {settings.PYFLOW_API_MAX_IDS} ids can be fetched at once')
+    return ids
+
+
+@api_view
+def api_posts(request):
+    names = requested_fields(request, POST_FIELDS)
+    if 'ids' in request.GET:
+        # Unknown ids are left out; the rest keep the requested order.
+        ids = parse_ids(request.GET['ids'])
+        return {'results': post_rows(ordered_by_ids(Post.objects.all(), ids), names)}
+    ordering = POST_ORDERINGS.get(request.GET.get('sort', 'new'))
+    if ordering is None:
+        raise ApiError(f'sort must be one of: {", ".join(POST_ORDERINGS)}')
+    posts = Post.objects.all()
+    if 'tag' in request.GET:
+        try:
+            posts = posts.filter(tags=int(request.GET['tag']))
+        except ValueError:
+            raise ApiError('tag must be an integer')
+    page = keyset_page(request, posts, ordering)
+    return listing(page, post_rows(page.object_list, names))
+
+
+@api_view
+def api_post(request, pk):
+    posts = post_rows(Post.objects.filter(pk=pk), requested_fields(request, POST_FIELDS))
+    if not posts:
+        raise ApiError('Post not found', status=404)
+    return posts[0]
+
+
+@api_view
+def api_post_comments(request, pk):
+    names = requested_fields(request, COMMENT_FIELDS)
+    if not Post.objects.filter(pk=pk).exists():
+        raise ApiError('Post not found', status=404)
+    page = keyset_page(request, Comment.objects.filter(post=pk), COMMENT_ORDERING)
+    rows = select(page.object_list, COMMENT_FIELDS, names)
+    return listing(page, [serialize(row, COMMENT_FIELDS, names) for row in rows])
+
+
+@api_view
+def api_post_series(request, pk):
+    if not Post.objects.filter(pk=pk).exists():
+        raise ApiError('Post not found', status=404)
+    return post_series(pk)
+
+
+@api_view
+def api_trending(request):
+    board = trending_posts()[:limit(request)]
+    titles = dict(Post.objects.filter(pk__in=[entry['post_id'] for entry in board]).values_list('pk', 'title'))
+    return {'results': [
+        {
+            'post': {'id': entry['post_id'], 'title': titles[entry['post_id']]},
+            'growth': round(entry['growth'], 3),
+            'recent': round(entry['recent'], 3),
+            'baseline': round(entry['baseline'], 3),
+        }
+        for entry in board if entry['post_id'] in titles
+    ]}
+
+
+@api_view
+def api_tags(request):
+    names = requested_fields(request, TAG_FIELDS)
+    page = keyset_page(request, Tag.objects.all(), TAG_ORDERING)
+    rows = select(page.object_list, TAG_FIELDS, names)
+    return listing(page, [serialize(row, TAG_FIELDS, names) for row in rows])
+
+
+@api_view
+def api_tag_autocomplete(request):
+    # Answered from the in-memory tag index, without a query per keystroke.
+    return {'results': tag_index.complete(request.GET.get('q', ''), limit(request))}
+
+
+@api_view
+def api_user(request, pk):
+    names = requested_fields(request, USER_FIELDS)
+    row = select(User.objects.filter(pk=pk, is_active=True), USER_FIELDS, names).first()
+    if row is None:
+        raise ApiError('User not found', status=404)
+    return serialize(row, USER_FIELDS, names)
@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(using, **kwargs):
+    from pyflow.search import install_search_index
+    install_search_index(connections[using])
 
 
 class PyflowConfig(AppConfig):
     name = 'pyflow'
+
+    def ready(self):
+        import pyflow.signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
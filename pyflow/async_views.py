@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta
+from functools import partial
+
+import pytz
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.shortcuts import render, get_object_or_404
+
+from pyflow import views
+from pyflow.feed import feed_queryset
+from pyflow.forms import CommentForm
+from pyflow.leaderboards import LeaderboardPaginator
+from pyflow.metrics import QueryTimer, current_timer, instrument_connections
+from pyflow.models import Post, PostViewerSketch, Tag
+from pyflow.page_cache import anonymous_page_cache
+from pyflow.pagination import paginate, paginate_with
+from pyflow.related import related_posts
+from pyflow.show_buffer import show_buffer
+from pyflow.sidebar import popular_tags
+
+_query_pool = None
+
+
+def query_pool():
+    global _query_pool
+    if _query_pool is None:
+        _query_pool = ThreadPoolExecutor(
+            max_workers=settings.PYFLOW_ASYNC_QUERY_WORKERS,
+            thread_name_prefix='pyflow-query',
+        )
+    return _query_pool
+
+
+def _call(fn, args, kwargs):
+    instrument_connections()
+    timer = QueryTimer()
+    token = current_timer.set(timer)
+    try:
+        return fn(*args, **kwargs), timer
+    finally:
+        current_timer.reset(token)
+        close_old_connections()
+
+
+async def run_query(fn, *args, **kwargs):
+    # Pool threads keep their own connections, which are closed after every
+    # call just like a request thread closes its own at the end of a request.
+    # The request's context (its replica choice among others) is copied to
+    # the pool thread.
+    loop = asyncio.get_running_loop()
+    call = partial(contextvars.copy_context().run, _call, fn, args, kwargs)
+    result, timer = await loop.run_in_executor(query_pool(), call)
+    request_timer = current_timer.get()
+    if request_timer is not None:
+        request_timer.merge(timer)
+    return result
+
+
+async def gather(*calls):
+    return await asyncio.gather(*(run_query(call) for call in calls))
+
+
+def evaluated(page):
+    len(page.object_list)
+    return page
+
+
+def fetched(queryset):
+    len(queryset)
+    return queryset
+
+
+async def render_async(request, template_name, context):
+    return await run_query(render, request, template_name, context)
+
+
+@anonymous_page_cache()
+async def view_main(request):
+    posts = Post.objects.filter()
+    page, posts_popular, tags = await gather(
+        lambda: evaluated(paginate(request, feed_queryset(posts), views.FEED_ORDERING)),
+        lambda: fetched(posts.order_by('-show_count')[:5]),
+        popular_tags,
+    )
+    context = {
+        'posts': page.object_list,
+        'page': page,
+        'posts_popular': posts_popular,
+        'tags': tags,
+    }
+    return await render_async(request, 'index.html', context)
+
+
+@anonymous_page_cache()
+async def view_sort_by_tag(request, pk):
+    _, page, tags = await gather(
+        lambda: get_object_or_404(Tag, id=pk),
+        lambda: evaluated(paginate(request, feed_queryset(Post.objects.filter(tags=pk)), views.FEED_ORDERING)),
+        popular_tags,
+    )
+    context = {
+        'posts': page.object_list,
+        'page': page,
+        'tags': tags,
+    }
+    return await render_async(request, 'posts_content.html', context)
+
+
+def _date_page(request, button):
+    posts = feed_queryset()
+    time = dt.now(tz=pytz.UTC)
+    if button == 'week':
+        time = time - timedelta(7)
+    if button == 'month':
+        time = time - timedelta(30)
+    if button == 'top':
+        return evaluated(paginate(request, posts, views.TOP_ORDERING))
+    if button == 'hot':
+        return evaluated(paginate(request, posts, views.HOT_ORDERING))
+    if button in ('top_week', 'top_month'):
+        return evaluated(paginate_with(request, LeaderboardPaginator(button[len('top_'):], posts)))
+    return evaluated(paginate(request, posts.filter(create_at__gt=time), views.FEED_ORDERING))
+
+
+@anonymous_page_cache()
+async def view_sort_by_date(request):
+    if request.method == 'GET':
+        button = request.GET['button']
+        page, tags = await gather(lambda: _date_page(request, button), popular_tags)
+        context = {
+            'posts': page.object_list,
+            'page': page,
+            'tags': tags,
+        }
+        return await render_async(request, 'posts_content.html', context)
+
+
+def _viewer(request):
+    return request.user if request.user.is_authenticated else None
+
+
+@anonymous_page_cache(post_kwarg='pk', on_hit=views.count_anonymous_show)
+async def view_detail(request, pk):
+    if request.method != 'GET':
+        return await sync_to_async(views.view_detail)(request, pk)
+    post, user, errors = await gather(
+        lambda: get_object_or_404(Post.objects.select_related('viewer_sketch'), id=pk),
+        partial(_viewer, request),
+        lambda: request.session.get('errors'),
+    )
+    try:
+        anonymous_viewers = post.viewer_sketch.estimate
+    except PostViewerSketch.DoesNotExist:
+        anonymous_viewers = 0
+    comments = post.comments
+    calls = [
+        lambda: fetched(comments.select_related('user').order_by('create_at')),
+        lambda: fetched(related_posts(post)),
+    ]
+    if user is not None:
+        calls += [
+            lambda: post.likes.filter(user=user).exists(),
+            lambda: set(comments.filter(Q(user=user) | Q(likes__user=user)).values_list('id', flat=True)),
+        ]
+    results = await gather(*calls)
+    context = {
+        'post': post,
+        'post_rating': post.rating,
+        'comments': results[0],
+        'form': CommentForm(),
+        'posts_by_tags': results[1],
+        'liked_post_by_user': False,
+        'anonymous_viewers': anonymous_viewers,
+    }
+    if errors:
+        context['errors'] = errors['comment']
+    if user is not None:
+        context['liked_post_by_user'] = results[2]
+        context['voted_comment_ids'] = results[3]
+        await run_query(show_buffer.add, post.pk, user.pk)
+    else:
+        await run_query(views.count_anonymous_show, request, post.pk)
+    return await render_async(request, 'detail.html', context)
@@ -0,0 +1,281 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_sizes = {}
+_usage = {}
+_culled = {}
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class MemoryCappedLocMemCache(LocMemCache):
+    # LocMemCache already keeps its keys in LRU order and culls from the
+    # cold end, but only by entry count. This variant also tracks the size
+    # of every pickled value and evicts least recently used entries until
+    # the total fits under OPTIONS['MAX_BYTES'].
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', 16 * 1024 * 1024))
+        self._sizes = _sizes.setdefault(name, {})
+        self._usage = _usage.setdefault(name, [0])
+
+    @property
+    def used_bytes(self):
+        return self._usage[0]
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._delete(key)
+        if len(value) > self._max_bytes:
+            return
+        super()._set(key, value, timeout)
+        self._sizes[key] = len(value)
+        self._usage[0] += len(value)
+        while self._usage[0] > self._max_bytes:
+            self._evict()
+
+    def _evict(self):
+        key, _ = self._cache.popitem()
+        del self._expire_info[key]
+        self._usage[0] -= self._sizes.pop(key, 0)
+
+    def _cull(self):
+        if self._cull_frequency == 0:
+            self._clear()
+        else:
+            for _ in range(len(self._cache) // self._cull_frequency):
+                self._evict()
+
+    def _delete(self, key):
+        if not super()._delete(key):
+            return False
+        self._usage[0] -= self._sizes.pop(key, 0)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version)
+        key = self.make_key(key, version=version)
+        with self._lock:
+            if key in self._cache:
+                size = len(self._cache[key])
+                self._usage[0] += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+        return value
+
+    def _clear(self):
+        self._cache.clear()
+        self._expire_info.clear()
+        self._sizes.clear()
+        self._usage[0] = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+
+class SharedFileCache(FileBasedCache):
+    # FileBasedCache.add() checks and writes in two steps, so two processes
+    # can both succeed; here the entry is linked into place, which fails if
+    # it already exists. Culling lists the whole directory, so it runs at
+    # most every OPTIONS['CULL_INTERVAL'] seconds rather than on every set,
+    # and the directory may overshoot MAX_ENTRIES in between.
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 60)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as file:
+                self._write_content(file, timeout, value)
+            # An expired entry is deleted by has_key(), so one more try.
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    try:
+                        if self.has_key(key, version):
+                            return False
+                    except FileNotFoundError:
+                        pass
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _cull(self):
+        now = time.monotonic()
+        if now - _culled.get(self._dir, -self._cull_interval) < self._cull_interval:
+            return
+        _culled[self._dir] = now
+        super()._cull()
+
+
+class TieredCache(BaseCache):
+    # An in-process LRU in front of the cache named by OPTIONS['SHARED'],
+    # which every process reads. Writes go through to both tiers; a local
+    # copy lives for at most LOCAL_TIMEOUT seconds, which bounds how long a
+    # write from another process can go unseen here.
+    #
+    # Entries are stored as (fresh_until, value). get_or_set() keeps what it
+    # computes for STALE_TIMEOUT seconds past its timeout and, once stale,
+    # returns it to every caller but the one refreshing it. Only one caller
+    # per key computes a missing value at a time, across threads and, with a
+    # lock key taken by the shared tier's add(), across processes; the
+    # others wait for its result. That takes a shared tier whose add() is
+    # atomic, as SharedFileCache's is, and a lock is given up after
+    # LOCK_TIMEOUT seconds even if its holder is still computing.
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared = options['SHARED']
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._stale_timeout = options.get('STALE_TIMEOUT', 30)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._poll_interval = options.get('POLL_INTERVAL', 0.05)
+        self.local = LocMemCache(f'tiered:{name}', {
+            'TIMEOUT': self._local_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def shared(self):
+        return caches[self._shared]
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _local_set(self, key, entry, version):
+        self.local.set(key, entry, self._local_timeout, version=version)
+
+    def _entry(self, key, version):
+        entry = self.local.get(key, version=version)
+        if entry is None:
+            entry = self.shared.get(key, version=version)
+            if entry is not None:
+                self._local_set(key, entry, version)
+        return entry
+
+    def _store(self, key, value, timeout, version, stale=0):
+        if timeout is not None and timeout <= 0:
+            self.delete(key, version=version)
+            return
+        entry = (None if timeout is None else time.time() + timeout, value)
+        self.shared.set(key, entry, None if timeout is None else timeout + stale, version=version)
+        self._local_set(key, entry, version)
+
+    @staticmethod
+    def _fresh(entry):
+        return entry is not None and (entry[0] is None or entry[0] > time.time())
+
+    def get(self, key, default=None, version=None):
+        entry = self._entry(key, version)
+        return entry[1] if self._fresh(entry) else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, self._timeout(timeout), version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        entry = (None if timeout is None else time.time() + timeout, value)
+        if not self.shared.add(key, entry, timeout, version=version):
+            return False
+        self._local_set(key, entry, version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        entry = self.shared.get(key, version=version)
+        if not self._fresh(entry):
+            return False
+        self._store(key, entry[1], self._timeout(timeout), version)
+        return True
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self._fresh(self._entry(key, version))
+
+    def incr(self, key, delta=1, version=None):
+        # Read from the shared tier, which other processes write to.
+        entry = self.shared.get(key, version=version)
+        if not self._fresh(entry):
+            raise ValueError(f"Key '{key}' not found")
+        value = entry[1] + delta
+        timeout = None if entry[0] is None else max(entry[0] - time.time(), 0.001)
+        self._store(key, value, timeout, version)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        entry = self._entry(key, version)
+        while not self._fresh(entry):
+            flight = self._begin(key, version)
+            if flight is not None:
+                try:
+                    value = default() if callable(default) else default
+                    if value is not None:
+                        self._store(key, value, timeout, version, stale=self._stale_timeout)
+                    return value
+                finally:
+                    self._end(key, version, flight)
+            if entry is not None:
+                # Someone else is refreshing it.
+                break
+            entry = self._wait(key, version)
+        return entry[1]
+
+    def _flight_key(self, key, version):
+        return self.shared.make_key(f'{key}:flight', version=version)
+
+    def _begin(self, key, version):
+        flight_key = self._flight_key(key, version)
+        with _flights_lock:
+            if flight_key in _flights:
+                return None
+            flight = _flights[flight_key] = threading.Event()
+        if self.shared.add(f'{key}:flight', 1, self._lock_timeout, version=version):
+            return flight
+        self._finish(flight_key, flight)
+        return None
+
+    def _end(self, key, version, flight):
+        self.shared.delete(f'{key}:flight', version=version)
+        self._finish(self._flight_key(key, version), flight)
+
+    def _finish(self, flight_key, flight):
+        with _flights_lock:
+            _flights.pop(flight_key, None)
+        flight.set()
+
+    def _wait(self, key, version):
+        # A flight in this process is waited on directly; one in another
+        # process is polled for until its lock key goes away.
+        with _flights_lock:
+            flight = _flights.get(self._flight_key(key, version))
+        deadline = time.monotonic() + self._lock_timeout
+        if flight is not None:
+            flight.wait(self._lock_timeout)
+        else:
+            while time.monotonic() < deadline and self.shared.has_key(f'{key}:flight', version=version):
+                time.sleep(self._poll_interval)
+        entry = self.shared.get(key, version=version)
+        if entry is not None:
+            self._local_set(key, entry, version)
+        return entry
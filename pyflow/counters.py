@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from pyflow.models import Comment, CommentLike, Post, PostLike, PostShow, PostShowDaily, Tag
+
+
+def _aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def rebuild_counters():
+    with transaction.atomic():
+        posts = Post.objects.update(
+            rating=_aggregate(PostLike, 'post', Sum('value')),
+            # Folded shows live in the daily rollups, the rest in the raw tail.
+            show_count=_aggregate(PostShowDaily, 'post', Sum('shows')) + _aggregate(PostShow, 'post', Count('id')),
+            comment_count=_aggregate(Comment, 'post', Count('id')),
+        )
+        comments = Comment.objects.update(
+            rating=_aggregate(CommentLike, 'comment', Sum('value')),
+        )
+        tags = Tag.objects.update(
+            post_count=_aggregate(Post.tags.through, 'tag', Count('id')),
+        )
+    return posts, comments, tags
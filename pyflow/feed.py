@@ -0,0 +1,13 @@
+from django.db.models import Prefetch
+
+from pyflow.models import Post, Tag
+
+
+def feed_queryset(queryset=None):
+    # Rating and the comment/show counts are denormalized columns on Post,
+    # so one page costs the row query plus one prefetch for the tags.
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('user').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('id', 'title')),
+    )
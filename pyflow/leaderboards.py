@@ -0,0 +1,140 @@
+import bisect
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from pyflow.models import Post, PostLike, PostScoreBucket, hot_score
+from pyflow.pagination import InvalidCursor, decode_cursor, make_page, ordered_by_ids
+
+PERIODS = {
+    'week': 7,
+    'month': 30,
+}
+
+
+def today():
+    return timezone.localdate()
+
+
+def leaderboard_key(period, day):
+    return f'pyflow:leaderboard:{period}:{day.isoformat()}'
+
+
+def record_vote(post_id, changes):
+    # `changes` maps days to score deltas. A missing bucket older than the
+    # longest window has been pruned and is not created again.
+    since = today() - timedelta(days=max(PERIODS.values()) - 1)
+    with transaction.atomic():
+        for day, delta in changes.items():
+            if not delta:
+                continue
+            buckets = PostScoreBucket.objects.filter(post_id=post_id, day=day)
+            if buckets.update(score=F('score') + delta) or day < since:
+                continue
+            try:
+                with transaction.atomic():
+                    PostScoreBucket.objects.create(post_id=post_id, day=day, score=delta)
+            except IntegrityError:
+                buckets.update(score=F('score') + delta)
+        post = Post.objects.filter(pk=post_id).values('rating', 'create_at').first()
+        if post is None:
+            return
+        Post.objects.filter(pk=post_id).update(hot_score=hot_score(post['rating'], post['create_at']))
+    for period in PERIODS:
+        _bump_leaderboard(period, post_id)
+
+
+def window_scores(period, post_ids=None):
+    since = today() - timedelta(days=PERIODS[period] - 1)
+    buckets = PostScoreBucket.objects.filter(day__gte=since)
+    if post_ids is not None:
+        buckets = buckets.filter(post_id__in=post_ids)
+    return buckets.values('post_id').annotate(total=Sum('score')).order_by('-total', '-post_id')
+
+
+def top_posts(period):
+    key = leaderboard_key(period, today())
+    board = cache.get(key)
+    if board is None:
+        rows = window_scores(period)[:settings.PYFLOW_LEADERBOARD_SIZE]
+        board = [(row['total'], row['post_id']) for row in rows]
+        cache.set(key, board, settings.PYFLOW_LEADERBOARD_TIMEOUT)
+    return board
+
+
+class LeaderboardPaginator:
+    def __init__(self, period, queryset, per_page=None):
+        self.board = top_posts(period)
+        self.queryset = queryset
+        self.per_page = per_page or settings.PYFLOW_PAGE_SIZE
+
+    def page(self, after=None, before=None):
+        keys = [(-score, -pk) for score, pk in self.board]
+        rows = [(pk, score, pk) for score, pk in self.board]
+        if before:
+            end = bisect.bisect_left(keys, self._key(before))
+            rows = rows[max(end - self.per_page - 1, 0):end][::-1]
+        elif after:
+            start = bisect.bisect_right(keys, self._key(after))
+            rows = rows[start:start + self.per_page + 1]
+        else:
+            rows = rows[:self.per_page + 1]
+        return make_page(rows, self.per_page, after, before, self._object_list)
+
+    def _key(self, cursor):
+        score, pk = decode_cursor(cursor, 2)
+        if not isinstance(score, int) or not isinstance(pk, int):
+            raise InvalidCursor(cursor)
+        return -score, -pk
+
+    def _object_list(self, ids):
+        return ordered_by_ids(self.queryset, ids)
+
+
+def _bump_leaderboard(period, post_id):
+    # Only a board that is already cached is patched: the voted post's
+    # window score is re-read from its own buckets and merged into the
+    # top-N. A missing board is rebuilt from the buckets on the next read.
+    key = leaderboard_key(period, today())
+    board = cache.get(key)
+    if board is None:
+        return
+    row = window_scores(period, [post_id]).first()
+    board = [entry for entry in board if entry[1] != post_id]
+    if row is not None:
+        board.append((row['total'], post_id))
+    board.sort(key=lambda entry: (-entry[0], -entry[1]))
+    cache.set(key, board[:settings.PYFLOW_LEADERBOARD_SIZE], settings.PYFLOW_LEADERBOARD_TIMEOUT)
+
+
+def prune_buckets(days=None):
+    since = today() - timedelta(days=days or max(PERIODS.values()))
+    return PostScoreBucket.objects.filter(day__lt=since).delete()[0]
+
+
+def rebuild_scores():
+    since = today() - timedelta(days=max(PERIODS.values()) - 1)
+    with transaction.atomic():
+        posts = []
+        for post in Post.objects.only('id', 'rating', 'create_at').iterator():
+            post.hot_score = hot_score(post.rating, post.create_at)
+            posts.append(post)
+        Post.objects.bulk_update(posts, ['hot_score'], batch_size=500)
+        PostScoreBucket.objects.all().delete()
+        rows = PostLike.objects.filter(post__isnull=False, score_day__gte=since).values(
+            'post_id', 'score_day',
+        ).annotate(score=Sum('value')).order_by()
+        PostScoreBucket.objects.bulk_create(
+            [PostScoreBucket(post_id=row['post_id'], day=row['score_day'], score=row['score']) for row in rows],
+            batch_size=500,
+        )
+    invalidate_leaderboards()
+    return len(posts)
+
+
+def invalidate_leaderboards():
+    cache.delete_many([leaderboard_key(period, today()) for period in PERIODS])
@@ -0,0 +1,83 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import loader
+from django.utils import timezone
+
+from pyflow.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_post_email(post, subject, receiver):
+    return OutboundEmail.objects.create(
+        subject=subject,
+        html_message=loader.render_to_string('email.html', {'post': post}),
+        from_email=settings.EMAIL_HOST_USER,
+        recipient=receiver,
+    )
+
+
+def claim_due(batch_size):
+    # Push the claimed rows' next attempt past the lease so that a second
+    # worker polling at the same time does not pick them up as well.
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update()
+            .filter(status=OutboundEmail.QUEUED, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.PYFLOW_MAIL_LEASE),
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def retry_delay(attempts):
+    delay = settings.PYFLOW_MAIL_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.PYFLOW_MAIL_MAX_RETRY_DELAY))
+
+
+def send_batch(batch_size=None):
+    messages = claim_due(batch_size or settings.PYFLOW_MAIL_BATCH_SIZE)
+    if not messages:
+        return 0, 0
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for message in messages:
+            email = EmailMultiAlternatives(
+                subject=message.subject,
+                body='',
+                from_email=message.from_email,
+                to=[message.recipient],
+                connection=connection,
+            )
+            email.attach_alternative(message.html_message, 'text/html')
+            try:
+                connection.open()
+                email.send()
+            except Exception as error:
+                logger.warning('Could not send email %s: %s', message.pk, error)
+                connection.close()
+                message.attempts += 1
+                message.last_error = str(error)
+                if message.attempts >= settings.PYFLOW_MAIL_MAX_ATTEMPTS:
+                    message.status = OutboundEmail.FAILED
+                else:
+                    message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+                message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+                failed += 1
+            else:
+                message.status = OutboundEmail.SENT
+                message.sent_at = timezone.now()
+                message.save(update_fields=['status', 'sent_at'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import include, path, reverse
+
+from pyflow import async_views, urls, views
+from pyflow.management.commands.benchmark_views import PERCENTILES, percentile
+from pyflow.models import Post, Tag
+from pyflow.show_buffer import show_buffer
+
+
+def urlconf(read_views):
+    # The project urls with the pyflow read views swapped for one flavour,
+    # so both paths can be measured in a single run whatever
+    # PYFLOW_ASYNC_VIEWS is set to.
+    root = __import__(settings.ROOT_URLCONF, fromlist=['urlpatterns'])
+    urlpatterns = [pattern for pattern in root.urlpatterns if getattr(pattern, 'urlconf_name', None) is not urls]
+    module = ModuleType(f'{settings.ROOT_URLCONF}.{read_views.__name__}')
+    module.urlpatterns = urlpatterns + [path('', include(urls.patterns(read_views)))]
+    return module
+
+
+class Command(BaseCommand):
+    help = 'Compare read view throughput of the threaded WSGI path against concurrent ASGI requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view and path')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        post = Post.objects.exclude(user=None).order_by('-comment_count', '-id').first()
+        tag = Tag.objects.order_by('-post_count', 'id').first()
+        if post is None or tag is None:
+            raise CommandError('The database needs at least one post and tag; run seed_data first')
+        # Requests are made as the post's author, so the anonymous page
+        # cache does not answer them.
+        targets = [
+            ('GET index', reverse('index')),
+            ('GET detail', reverse('detail', args=[post.pk])),
+            ('GET post-by-tag', reverse('post-by-tag', args=[tag.pk])),
+            ('GET post-by-date?button=hot', f"{reverse('post-by-date')}?button=hot"),
+        ]
+
+        try:
+            setup_test_environment()
+            owns_environment = True
+        except RuntimeError:
+            # Already inside a test run.
+            owns_environment = False
+        try:
+            report = {
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'async_views': settings.PYFLOW_ASYNC_VIEWS,
+                'views': {},
+            }
+            for label, url in targets:
+                with override_settings(ROOT_URLCONF=urlconf(views)):
+                    wsgi = self.measure_wsgi(post.user, url, options)
+                with override_settings(ROOT_URLCONF=urlconf(async_views)):
+                    asgi = asyncio.run(self.measure_asgi(post.user, url, options))
+                report['views'][label] = {
+                    'url': url,
+                    'wsgi': wsgi,
+                    'asgi': asgi,
+                    'speedup': round(asgi['requests_per_sec'] / wsgi['requests_per_sec'], 3),
+                }
+        finally:
+            if owns_environment:
+                teardown_test_environment()
+            # Benchmark shows are not real traffic.
+            show_buffer.clear()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure_wsgi(self, user, url, options):
+        clients = []
+        for _ in range(options['concurrency']):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def worker(i):
+            start = time.perf_counter()
+            response = clients[i % len(clients)].get(url)
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(worker, range(options['requests'])))
+        return self.summary(results, time.perf_counter() - start)
+
+    async def measure_asgi(self, user, url, options):
+        client = AsyncClient()
+        await async_views.run_query(client.force_login, user)
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def worker():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(worker() for _ in range(options['requests'])))
+        return self.summary(results, time.perf_counter() - start)
+
+    def summary(self, results, elapsed):
+        latencies = [latency * 1000 for latency, _ in results]
+        result = {f'p{p}_ms': round(percentile(latencies, p), 3) for p in PERCENTILES}
+        result.update({
+            'requests_per_sec': round(len(results) / elapsed, 2),
+            'statuses': sorted({status for _, status in results}),
+        })
+        return result
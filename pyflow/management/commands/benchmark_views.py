@@ -0,0 +1,134 @@
+import json
+import math
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from accounts.urls import urlpatterns as accounts_urlpatterns
+from pyflow.leaderboards import invalidate_leaderboards
+from pyflow.models import Comment, Post, Tag
+from pyflow.show_buffer import show_buffer
+from pyflow.urls import urlpatterns as pyflow_urlpatterns
+
+PERCENTILES = (50, 95, 99)
+# Views most traffic reaches signed out, through the anonymous page cache.
+ANONYMOUS_READS = ('index', 'detail', 'post-by-tag', 'post-by-date', 'search-posts')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Time every pyflow and accounts URL through the test client and print the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        post = Post.objects.exclude(user=None).order_by('-comment_count', '-id').first()
+        comment = Comment.objects.order_by('-id').first()
+        tag = Tag.objects.order_by('-post_count', 'id').first()
+        if post is None or comment is None or tag is None:
+            raise CommandError('The database needs at least one post, comment and tag; run seed_data first')
+        word = post.title.split()[0]
+        post_ids = Post.objects.order_by('-id').values_list('id', flat=True)[:20]
+        targets = [
+            ('GET index', 'index', 'get', reverse('index'), {}),
+            ('GET detail', 'detail', 'get', reverse('detail', args=[post.pk]), {}),
+            ('POST detail', 'detail', 'post', reverse('detail', args=[post.pk]), {'comment': 'benchmark comment'}),
+            ('GET create-post', 'create-post', 'get', reverse('create-post'), {}),
+            ('GET edit-delete-post', 'edit-delete-post', 'get', reverse('edit-delete-post', args=[post.pk]), {}),
+            ('GET post-by-tag', 'post-by-tag', 'get', reverse('post-by-tag', args=[tag.pk]), {}),
+            *[
+                (f'GET post-by-date?button={button}', 'post-by-date', 'get', reverse('post-by-date'), {'button': button})
+                for button in ('top', 'hot', 'top_week', 'top_month', 'week', 'month')
+            ],
+            ('GET delete-comment', 'delete-comment', 'get', reverse('delete-comment', args=[comment.pk]), {}),
+            ('POST rating/post', 'rating', 'post', reverse('rating', args=['post', post.pk]), {'button': 'like'}),
+            ('POST rating/comment', 'rating', 'post', reverse('rating', args=['comment', comment.pk]), {'button': 'like'}),
+            ('GET send-post', 'send-post', 'get', reverse('send-post', args=[post.pk]), {}),
+            ('GET search-posts', 'search-posts', 'get', reverse('search-posts'), {'q': word}),
+            ('GET metrics', 'metrics', 'get', reverse('metrics'), {}),
+            ('GET api-posts', 'api-posts', 'get', reverse('api-posts'), {}),
+            ('GET api-posts?ids', 'api-posts', 'get', reverse('api-posts'), {'ids': ','.join(map(str, post_ids))}),
+            ('GET api-post', 'api-post', 'get', reverse('api-post', args=[post.pk]), {}),
+            ('GET api-post-comments', 'api-post-comments', 'get', reverse('api-post-comments', args=[post.pk]), {}),
+            ('GET api-post-series', 'api-post-series', 'get', reverse('api-post-series', args=[post.pk]), {}),
+            ('GET api-trending', 'api-trending', 'get', reverse('api-trending'), {}),
+            ('GET api-tags', 'api-tags', 'get', reverse('api-tags'), {}),
+            ('GET api-tag-autocomplete', 'api-tag-autocomplete', 'get', reverse('api-tag-autocomplete'), {'q': tag.title[:2]}),
+            ('GET api-user', 'api-user', 'get', reverse('api-user', args=[post.user_id]), {}),
+            ('GET signup', 'signup', 'get', reverse('signup'), {}),
+            ('GET profile', 'profile', 'get', reverse('profile'), {}),
+            ('GET top-users', 'top-users', 'get', reverse('top-users'), {}),
+        ]
+        names = {pattern.name for pattern in pyflow_urlpatterns + accounts_urlpatterns}
+        missing = names - {target[1] for target in targets}
+        if missing:
+            raise CommandError(f'No benchmark target for: {", ".join(sorted(missing))}')
+
+        try:
+            setup_test_environment()
+            owns_environment = True
+        except RuntimeError:
+            # Already inside a test run.
+            owns_environment = False
+        try:
+            client = Client()
+            client.force_login(post.user)
+            anonymous = Client()
+            report = {
+                'iterations': options['iterations'],
+                'rows': {model.__name__: model.objects.count() for model in (User, Post, Comment, Tag)},
+                'views': {},
+            }
+            for label, name, method, url, data in targets:
+                report['views'][label] = self.measure(client, method, url, data, options)
+                if method == 'get' and name in ANONYMOUS_READS:
+                    report['views'][f'{label} (anonymous)'] = self.measure(anonymous, method, url, data, options)
+        finally:
+            if owns_environment:
+                teardown_test_environment()
+            # Rolled back votes may have patched the cached boards.
+            show_buffer.clear()
+            invalidate_leaderboards()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure(self, client, method, url, data, options):
+        latencies, queries, status = [], [], None
+        for i in range(options['warmup'] + options['iterations']):
+            # Writes are rolled back so every iteration sees the same data.
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+            status = response.status_code
+            if i >= options['warmup']:
+                latencies.append(elapsed * 1000)
+                queries.append(len(captured))
+        result = {f'p{p}_ms': round(percentile(latencies, p), 3) for p in PERCENTILES}
+        result.update({
+            'url': url,
+            'status': status,
+            'queries': percentile(queries, 50),
+            'max_queries': max(queries),
+        })
+        return result
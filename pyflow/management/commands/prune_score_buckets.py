@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pyflow.leaderboards import prune_buckets
+
+
+class Command(BaseCommand):
+    help = 'Delete daily vote score buckets that no leaderboard window covers any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Buckets to keep, defaults to the longest window')
+
+    def handle(self, *args, **options):
+        deleted = prune_buckets(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} score buckets'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pyflow.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recalculate denormalized post, comment and tag counters from the raw rows'
+
+    def handle(self, *args, **options):
+        posts, comments, tags = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters for {posts} posts, {comments} comments and {tags} tags'
+        ))
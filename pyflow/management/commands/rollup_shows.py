@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pyflow.rollups import rollup_shows
+
+
+class Command(BaseCommand):
+    help = 'Fold post shows older than --days into daily totals and delete the raw rows in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Raw shows to keep, defaults to PYFLOW_ROLLUP_DAYS')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        folded = rollup_shows(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {folded} shows into daily totals'))
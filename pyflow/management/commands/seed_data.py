@@ -0,0 +1,152 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.stats import rebuild_user_stats
+from pyflow.counters import rebuild_counters
+from pyflow.leaderboards import rebuild_scores
+from pyflow.models import Comment, CommentLike, Post, PostLike, PostShow, Tag
+from pyflow.sidebar import invalidate_popular_tags
+
+WORDS = (
+    'python django query index cache thread async model view template form migration signal '
+    'middleware cursor page search tag post comment vote user profile feed sqlite postgres '
+    'transaction lock queue worker deploy docker test fixture benchmark latency memory'
+).split()
+
+
+def zipf_sampler(rng, items, exponent):
+    weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(items) + 1)))
+    return lambda k=1: rng.choices(items, cum_weights=weights, k=k)
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic dataset for profiling and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=300)
+        parser.add_argument('--likes', type=int, default=20000)
+        parser.add_argument('--shows', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--comment-likes', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=90, help='Spread post dates over this many days')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for tag and post popularity')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['posts'] < 1 or options['tags'] < 1:
+            raise CommandError('At least one user, post and tag are required')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            users = self.seed_users(options['users'])
+            tags = self.seed_tags(options['tags'])
+            posts = self.seed_posts(options['posts'], users, options['days'])
+            self.seed_post_tags(posts, zipf_sampler(self.rng, tags, options['zipf']))
+            popular_post = zipf_sampler(self.rng, posts, options['zipf'])
+            self.seed_votes(PostLike, 'post_id', options['likes'], users, popular_post)
+            self.seed_shows(options['shows'], users, popular_post)
+            comments = self.seed_comments(options['comments'], users, popular_post)
+            if comments:
+                self.seed_votes(CommentLike, 'comment_id', options['comment_likes'], users,
+                                zipf_sampler(self.rng, comments, options['zipf']))
+            rebuild_counters()
+            rebuild_scores()
+            rebuild_user_stats()
+        invalidate_popular_tags()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(tags)} tags, {len(posts)} posts and {len(comments)} comments'
+        ))
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def created(self, model, rows):
+        # SQLite does not hand primary keys back from bulk_create, so the new
+        # rows are read back as everything above the previous maximum id.
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        model.objects.bulk_create(rows, batch_size=self.batch_size)
+        return list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True))
+
+    def seed_users(self, count):
+        offset = User.objects.count()
+        return self.created(User, [User(username=f'seed{offset + i}', password='!') for i in range(count)])
+
+    def seed_tags(self, count):
+        offset = Tag.objects.count()
+        titles = [f'{self.rng.choice(WORDS)}-{offset + i}' for i in range(count)]
+        return self.created(Tag, [Tag(title=title) for title in titles])
+
+    def seed_posts(self, count, users, days):
+        now = timezone.now()
+        posts = self.created(
+            Post,
+            [
+                Post(
+                    title=self.words(3, 8),
+                    content=self.words(30, 120),
+                    content_code=self.words(0, 20),
+                    user_id=self.rng.choice(users),
+                )
+                for _ in range(count)
+            ],
+        )
+        # auto_now_add overwrites create_at on insert, so the dates are
+        # spread out in a second pass.
+        Post.objects.bulk_update(
+            [Post(pk=pk, create_at=now - timedelta(seconds=self.rng.randint(0, days * 24 * 60 * 60))) for pk in posts],
+            ['create_at'],
+            batch_size=self.batch_size,
+        )
+        return posts
+
+    def seed_post_tags(self, posts, popular_tag):
+        Through = Post.tags.through
+        rows = []
+        for post_id in posts:
+            for tag_id in set(popular_tag(self.rng.randint(1, 5))):
+                rows.append(Through(post_id=post_id, tag_id=tag_id))
+        Through.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def pairs(self, count, users, popular_object):
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            pairs.add((popular_object()[0], self.rng.choice(users)))
+        return pairs
+
+    def seed_votes(self, model, fk, count, users, popular_object):
+        model.objects.bulk_create(
+            [
+                model(**{fk: object_id}, user_id=user_id, value=1 if self.rng.random() < 0.8 else -1)
+                for object_id, user_id in self.pairs(count, users, popular_object)
+            ],
+            batch_size=self.batch_size,
+            # A voter already has a vote on the object from an earlier run.
+            ignore_conflicts=True,
+        )
+
+    def seed_shows(self, count, users, popular_post):
+        PostShow.objects.bulk_create(
+            [PostShow(post_id=post_id, user_id=user_id) for post_id, user_id in self.pairs(count, users, popular_post)],
+            batch_size=self.batch_size,
+        )
+
+    def seed_comments(self, count, users, popular_post):
+        return self.created(
+            Comment,
+            [
+                Comment(comment=self.words(5, 40), post_id=popular_post()[0], user_id=self.rng.choice(users))
+                for _ in range(count)
+            ],
+        )
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from pyflow.replicas import copy_database, write_heartbeat
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replicas, standing in for replication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replica aliases to refresh; all of them by default')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.PYFLOW_REPLICAS
+        if not aliases:
+            raise CommandError('No replicas are configured; set PYFLOW_READ_REPLICAS')
+        unknown = set(aliases) - set(settings.PYFLOW_REPLICAS)
+        if unknown:
+            raise CommandError(f'Not a replica: {", ".join(sorted(unknown))}')
+        if any(connections[alias].vendor != 'sqlite' for alias in [DEFAULT_DB_ALIAS, *aliases]):
+            raise CommandError('sync_replica only copies SQLite databases')
+        # The heartbeat goes out with the copy, so replicas know how stale
+        # they are.
+        write_heartbeat()
+        for alias in aliases:
+            connections[alias].close()
+            copy_database(connections[DEFAULT_DB_ALIAS], connections[alias].settings_dict['NAME'])
+            self.stdout.write(f'Copied {DEFAULT_DB_ALIAS} to {alias}')
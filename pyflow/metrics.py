@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+
+class ViewStats:
+    __slots__ = ('requests', 'buckets', 'latency', 'queries', 'sql_time')
+
+    def __init__(self, size):
+        self.requests = 0
+        self.buckets = [0] * size
+        self.latency = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.latency += other.latency
+        self.queries += other.queries
+        self.sql_time += other.sql_time
+
+
+class MetricsRegistry:
+    # Every thread records into its own shard, so the request path never
+    # takes the lock; it is only held to register a new shard and while a
+    # scrape copies the shard list.
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+        self.generation = 0
+
+    def _shard(self):
+        local = self.local
+        if getattr(local, 'generation', None) != self.generation:
+            with self.lock:
+                local.shard = {}
+                local.generation = self.generation
+                self.shards.append(local.shard)
+        return local.shard
+
+    def record(self, view, latency, queries, sql_time):
+        shard = self._shard()
+        stats = shard.get(view)
+        if stats is None:
+            stats = shard[view] = ViewStats(len(self.buckets) + 1)
+        stats.requests += 1
+        stats.buckets[bisect.bisect_left(self.buckets, latency)] += 1
+        stats.latency += latency
+        stats.queries += queries
+        stats.sql_time += sql_time
+
+    def snapshot(self):
+        with self.lock:
+            shards = list(self.shards)
+        totals = {}
+        for shard in shards:
+            for view, stats in list(shard.items()):
+                total = totals.get(view)
+                if total is None:
+                    total = totals[view] = ViewStats(len(self.buckets) + 1)
+                total.merge(stats)
+        return totals
+
+    def reset(self):
+        with self.lock:
+            self.shards = []
+            self.generation += 1
+
+
+current_timer = contextvars.ContextVar('pyflow_query_timer', default=None)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def merge(self, other):
+        self.queries += other.queries
+        self.time += other.time
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.time += time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def instrument_connections(**kwargs):
+    # Connections belong to a thread, and request_started is sent from the
+    # thread that runs the sync part of a request under WSGI and ASGI alike;
+    # sync_to_async carries current_timer over to it.
+    for conn in connections.all():
+        if record_query not in conn.execute_wrappers:
+            conn.execute_wrappers.append(record_query)
+
+
+request_started.connect(instrument_connections)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        self.record(request, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        # Async views run their queries in the query pool, which merges the
+        # time spent there into the timer found in this context.
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        self.record(request, time.perf_counter() - start, timer)
+        return response
+
+    def record(self, request, latency, timer):
+        match = request.resolver_match
+        registry.record(match.view_name if match else 'unresolved', latency, timer.queries, timer.time)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    lines = [
+        '# HELP pyflow_request_duration_seconds Request latency by view.',
+        '# TYPE pyflow_request_duration_seconds histogram',
+    ]
+    snapshot = sorted(registry.snapshot().items())
+    for view, stats in snapshot:
+        view = _label(view)
+        count = 0
+        for bound, hits in zip(registry.buckets + ('+Inf',), stats.buckets):
+            count += hits
+            lines.append(f'pyflow_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+        lines.append(f'pyflow_request_duration_seconds_sum{{view="{view}"}} {stats.latency:.6f}')
+        lines.append(f'pyflow_request_duration_seconds_count{{view="{view}"}} {stats.requests}')
+    lines += [
+        '# HELP pyflow_sql_queries_total SQL queries issued by view.',
+        '# TYPE pyflow_sql_queries_total counter',
+    ]
+    lines += [f'pyflow_sql_queries_total{{view="{_label(view)}"}} {stats.queries}' for view, stats in snapshot]
+    lines += [
+        '# HELP pyflow_sql_duration_seconds_total Time spent in SQL queries by view.',
+        '# TYPE pyflow_sql_duration_seconds_total counter',
+    ]
+    lines += [f'pyflow_sql_duration_seconds_total{{view="{_label(view)}"}} {stats.sql_time:.6f}' for view, stats in snapshot]
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(settings.PYFLOW_METRICS_BUCKETS)
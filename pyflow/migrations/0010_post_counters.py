@@ -0,0 +1,58 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('pyflow', 'Post')
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    PostShow = apps.get_model('pyflow', 'PostShow')
+    Comment = apps.get_model('pyflow', 'Comment')
+    CommentLike = apps.get_model('pyflow', 'CommentLike')
+    Post.objects.update(
+        rating=aggregate(PostLike, 'post', Sum('value')),
+        show_count=aggregate(PostShow, 'post', Count('id')),
+        comment_count=aggregate(Comment, 'post', Count('id')),
+    )
+    Comment.objects.update(rating=aggregate(CommentLike, 'comment', Sum('value')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0009_auto_20210416_0722'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='show_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
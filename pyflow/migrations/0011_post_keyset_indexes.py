@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0010_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['create_at', 'id'], name='post_create_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['rating', 'id'], name='post_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, OperationalError
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE pyflow_post_fts USING fts5("
+    "title, content, content='pyflow_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO pyflow_post_fts(pyflow_post_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    "CREATE TRIGGER pyflow_post_fts_ai AFTER INSERT ON pyflow_post BEGIN "
+    "INSERT INTO pyflow_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER pyflow_post_fts_ad AFTER DELETE ON pyflow_post BEGIN "
+    "INSERT INTO pyflow_post_fts(pyflow_post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER pyflow_post_fts_au AFTER UPDATE OF title, content ON pyflow_post BEGIN "
+    "INSERT INTO pyflow_post_fts(pyflow_post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO pyflow_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "INSERT INTO pyflow_post_fts(pyflow_post_fts) VALUES('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS pyflow_post_fts_ai',
+    'DROP TRIGGER IF EXISTS pyflow_post_fts_ad',
+    'DROP TRIGGER IF EXISTS pyflow_post_fts_au',
+    'DROP TABLE IF EXISTS pyflow_post_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL[0])
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE filters.
+            return
+        for sql in CREATE_SQL[1:]:
+            cursor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0011_post_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_post_count(apps, schema_editor):
+    Tag = apps.get_model('pyflow', 'Tag')
+    Through = apps.get_model('pyflow', 'Post').tags.through
+    counts = Through.objects.filter(tag=OuterRef('pk')).order_by().values('tag').annotate(total=Count('id'))
+    Tag.objects.update(
+        post_count=Coalesce(Subquery(counts.values('total'), output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0012_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(fill_post_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0013_tag_post_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewerSketch',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='viewer_sketch', serialize=False, to='pyflow.post')),
+                ('registers', models.BinaryField()),
+                ('estimate', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
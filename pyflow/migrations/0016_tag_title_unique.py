@@ -0,0 +1,42 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    Tag = apps.get_model('pyflow', 'Tag')
+    Through = apps.get_model('pyflow', 'Post').tags.through
+    groups = {}
+    for pk, title in Tag.objects.order_by('id').values_list('id', 'title'):
+        groups.setdefault(title.strip().lower(), []).append((pk, title))
+    for normalized, tags in groups.items():
+        (keeper, title), duplicates = tags[0], [pk for pk, _ in tags[1:]]
+        if duplicates:
+            linked = set(Through.objects.filter(tag_id=keeper).values_list('post_id', flat=True))
+            moved = set(Through.objects.filter(tag_id__in=duplicates).values_list('post_id', flat=True)) - linked
+            Through.objects.bulk_create([Through(post_id=post_id, tag_id=keeper) for post_id in moved])
+            Tag.objects.filter(id__in=duplicates).delete()
+        if title != normalized:
+            Tag.objects.filter(id=keeper).update(title=normalized)
+    counts = Through.objects.filter(tag=OuterRef('pk')).order_by().values('tag').annotate(total=Count('id'))
+    Tag.objects.update(
+        post_count=Coalesce(Subquery(counts.values('total'), output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0015_outboundemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='title',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
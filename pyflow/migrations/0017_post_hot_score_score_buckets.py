@@ -0,0 +1,74 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:51
+
+import math
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+HOT_EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def fill_scores(apps, schema_editor):
+    Post = apps.get_model('pyflow', 'Post')
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    PostScoreBucket = apps.get_model('pyflow', 'PostScoreBucket')
+    posts = []
+    for post in Post.objects.only('id', 'rating', 'create_at').iterator():
+        order = math.log10(max(abs(post.rating), 1))
+        sign = (post.rating > 0) - (post.rating < 0)
+        post.hot_score = round(sign * order + (post.create_at - HOT_EPOCH).total_seconds() / 45000, 7)
+        posts.append(post)
+    Post.objects.bulk_update(posts, ['hot_score'], batch_size=500)
+    since = timezone.now() - timedelta(days=30)
+    rows = PostLike.objects.filter(create_at__gte=since, post__isnull=False).annotate(
+        day=TruncDate('create_at'),
+    ).values('post_id', 'day').annotate(score=Sum('value')).order_by()
+    PostScoreBucket.objects.bulk_create(
+        [PostScoreBucket(post_id=row['post_id'], day=row['day'], score=row['score']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0016_tag_title_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScoreBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('score', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hot_score', 'id'], name='post_hot_score_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='postscorebucket',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_buckets', to='pyflow.post'),
+        ),
+        migrations.AddIndex(
+            model_name='postscorebucket',
+            index=models.Index(fields=['day', 'post'], name='score_bucket_day_post_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postscorebucket',
+            constraint=models.UniqueConstraint(fields=('post', 'day'), name='unique_post_score_bucket'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
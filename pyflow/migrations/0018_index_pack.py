@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0017_post_hot_score_score_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'create_at'], name='comment_post_create_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['show_count'], name='post_show_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['post', 'user'], name='post_like_post_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postshow',
+            index=models.Index(fields=['post', 'user'], name='post_show_post_user_idx'),
+        ),
+    ]
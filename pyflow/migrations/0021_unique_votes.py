@@ -0,0 +1,89 @@
+# Generated by Django 3.1.7 on 2026-10-18 18:20
+
+import math
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.db.models import F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+HOT_EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+CHUNK = 500
+
+
+def aggregate(model, fk, expression):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(
+        Subquery(rows.annotate(total=expression).values('total'), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK):
+        yield ids[start:start + CHUNK]
+
+
+def drop_duplicates(model, fk):
+    # Only the latest vote of every voter survives.
+    votes = model.objects.filter(**{f'{fk}__isnull': False, 'user__isnull': False})
+    latest = votes.order_by().values(fk, 'user').annotate(last=Max('id')).values('last')
+    duplicates = votes.exclude(id__in=latest)
+    affected = set(duplicates.values_list(f'{fk}_id', flat=True).distinct())
+    duplicates.delete()
+    return affected
+
+
+def compact_votes(apps, schema_editor):
+    Post = apps.get_model('pyflow', 'Post')
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    PostScoreBucket = apps.get_model('pyflow', 'PostScoreBucket')
+    Comment = apps.get_model('pyflow', 'Comment')
+    CommentLike = apps.get_model('pyflow', 'CommentLike')
+
+    since = timezone.now() - timedelta(days=30)
+    for ids in chunks(drop_duplicates(PostLike, 'post')):
+        Post.objects.filter(pk__in=ids).update(
+            rating=aggregate(PostLike, 'post', Sum('value')),
+            version=F('version') + 1,
+        )
+        posts = list(Post.objects.filter(pk__in=ids).only('id', 'rating', 'create_at'))
+        for post in posts:
+            order = math.log10(max(abs(post.rating), 1))
+            sign = (post.rating > 0) - (post.rating < 0)
+            post.hot_score = round(sign * order + (post.create_at - HOT_EPOCH).total_seconds() / 45000, 7)
+        Post.objects.bulk_update(posts, ['hot_score'])
+        PostScoreBucket.objects.filter(post_id__in=ids).delete()
+        rows = PostLike.objects.filter(post_id__in=ids, create_at__gte=since).annotate(
+            day=TruncDate('create_at'),
+        ).values('post_id', 'day').annotate(score=Sum('value')).order_by()
+        PostScoreBucket.objects.bulk_create(
+            [PostScoreBucket(post_id=row['post_id'], day=row['day'], score=row['score']) for row in rows],
+        )
+    for ids in chunks(drop_duplicates(CommentLike, 'comment')):
+        Comment.objects.filter(pk__in=ids).update(rating=aggregate(CommentLike, 'comment', Sum('value')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0020_replica_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commentlike',
+            constraint=models.UniqueConstraint(fields=('comment', 'user'), name='comment_like_comment_user_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='postlike',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='post_like_post_user_unique'),
+        ),
+        migrations.RemoveIndex(
+            model_name='postlike',
+            name='post_like_post_user_idx',
+        ),
+    ]
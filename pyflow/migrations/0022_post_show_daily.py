@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-18 18:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0021_unique_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostShowDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shows', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='show_days', to='pyflow.post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postshowdaily',
+            constraint=models.UniqueConstraint(fields=('post', 'day'), name='unique_post_show_daily'),
+        ),
+    ]
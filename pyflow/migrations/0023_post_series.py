@@ -0,0 +1,30 @@
+# Generated by Django 3.1.7 on 2026-10-18 18:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0022_post_show_daily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSeries',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='series', serialize=False, to='pyflow.post')),
+                ('hour', models.IntegerField(default=0)),
+                ('day', models.IntegerField(default=0)),
+                ('hourly_shows', models.BinaryField(default=bytes)),
+                ('hourly_votes', models.BinaryField(default=bytes)),
+                ('daily_shows', models.BinaryField(default=bytes)),
+                ('daily_votes', models.BinaryField(default=bytes)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postseries',
+            index=models.Index(fields=['hour'], name='post_series_hour_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:12
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_score_days(apps, schema_editor):
+    PostLike = apps.get_model('pyflow', 'PostLike')
+    PostScoreBucket = apps.get_model('pyflow', 'PostScoreBucket')
+    PostLike.objects.update(score_day=TruncDate('create_at'))
+    # Changed votes were booked as deltas on the day of the change, which a
+    # later delete could not take off exactly: the buckets are rebuilt from
+    # the day each vote's value is now held on.
+    since = timezone.localdate() - timedelta(days=29)
+    rows = PostLike.objects.filter(score_day__gte=since, post__isnull=False).values(
+        'post_id', 'score_day',
+    ).annotate(score=Sum('value')).order_by()
+    PostScoreBucket.objects.all().delete()
+    PostScoreBucket.objects.bulk_create(
+        [PostScoreBucket(post_id=row['post_id'], day=row['score_day'], score=row['score']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0023_post_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postlike',
+            name='score_day',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_score_days, migrations.RunPython.noop),
+    ]
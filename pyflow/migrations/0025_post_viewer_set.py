@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyflow', '0024_postlike_score_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewerSet',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='viewer_set', serialize=False, to='pyflow.post')),
+                ('user_ids', models.BinaryField(default=bytes)),
+            ],
+        ),
+    ]
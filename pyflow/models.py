@@ -1,7 +1,23 @@
-from django.db import models
+import math
+from datetime import datetime
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+HOT_EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def hot_score(rating, create_at):
+    # Newer posts gain 1 point per 12.5 hours, the same as a tenfold
+    # rating, so the order decays with age without ever being recomputed.
+    order = math.log10(max(abs(rating), 1))
+    sign = (rating > 0) - (rating < 0)
+    return round(sign * order + (create_at - HOT_EPOCH).total_seconds() / 45000, 7)
+
+
 class Post(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
@@ -14,10 +30,58 @@ class Post(models.Model):
         on_delete=models.CASCADE,
         related_name='posts'
     )
+    rating = models.IntegerField(default=0)
+    show_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    hot_score = models.FloatField(default=0)
+    version = models.PositiveIntegerField(default=0)
+
+    # Maintained with F() updates; version is bumped by every write that
+    # changes what a rendered post card shows.
+    counter_fields = ('rating', 'show_count', 'comment_count', 'hot_score', 'version')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['create_at', 'id'], name='post_create_at_id_idx'),
+            models.Index(fields=['rating', 'id'], name='post_rating_id_idx'),
+            models.Index(fields=['hot_score', 'id'], name='post_hot_score_id_idx'),
+            models.Index(fields=['show_count'], name='post_show_count_idx'),
+        ]
 
     def __str__(self):
         return f'{self.pk} {self.title}'
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.hot_score = hot_score(self.rating, self.create_at or timezone.now())
+            return super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Post.objects.filter(pk=self.pk).update(version=F('version') + 1)
+
+
+def cast_vote(model, value, **lookup):
+    # One row per voter and object: voting again changes the row in place,
+    # and save() moves the counters by the difference only.
+    with transaction.atomic():
+        vote = model.objects.select_for_update().filter(**lookup).first()
+        if vote is None:
+            try:
+                with transaction.atomic():
+                    return model.objects.create(value=value, **lookup)
+            except IntegrityError:
+                vote = model.objects.select_for_update().get(**lookup)
+        if vote.value != value:
+            vote.delta = value - vote.value
+            vote.value = value
+            vote.save(update_fields=['value'])
+        return vote
+
 
 class PostLike(models.Model):
     value = models.IntegerField()
@@ -34,10 +98,50 @@ class PostLike(models.Model):
         on_delete=models.CASCADE,
         related_name='post_likes',
     )
+    # The day whose leaderboard bucket holds this vote's value.
+    score_day = models.DateField(null=True)
+    # What this save changes the rating by; post_save receivers read it.
+    delta = 0
+    # What this save changes the leaderboard buckets by, per day.
+    score_changes = None
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='post_like_post_user_unique'),
+        ]
 
     def __str__(self):
         return f'{self.pk} value: {self.value} | {self.post}'
 
+    @classmethod
+    def vote(cls, post_id, user_id, value):
+        return cast_vote(cls, value, post_id=post_id, user_id=user_id)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.delta = self.value
+        if self.delta:
+            # A changed vote moves its whole value to today's bucket, so a
+            # delete can take it off the one bucket that holds it.
+            day = timezone.localdate()
+            self.score_changes = {day: self.value}
+            if self.score_day is not None and not self._state.adding:
+                previous = self.value - self.delta
+                self.score_changes[self.score_day] = self.score_changes.get(self.score_day, 0) - previous
+            self.score_day = day
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = [*kwargs['update_fields'], 'score_day']
+        with transaction.atomic():
+            # The rating is bumped first so post_save receivers (the hot
+            # score) already see the new value.
+            if self.delta:
+                Post.objects.filter(pk=self.post_id).update(
+                    rating=F('rating') + self.delta,
+                    version=F('version') + 1,
+                )
+            super().save(*args, **kwargs)
+        self.delta = 0
+
 
 class PostShow(models.Model):
     post = models.ForeignKey(
@@ -54,9 +158,120 @@ class PostShow(models.Model):
         related_name='post_shows',
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'user'], name='post_show_post_user_idx'),
+        ]
+
     def __str__(self):
         return f'{self.post} show: {self.create_at}'
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                Post.objects.filter(pk=self.post_id).update(
+                    show_count=F('show_count') + 1,
+                    version=F('version') + 1,
+                )
+
+
+class PostShowDaily(models.Model):
+    # Shows older than PYFLOW_ROLLUP_DAYS, folded per day by rollup_shows.
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='show_days',
+    )
+    day = models.DateField()
+    shows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_post_show_daily'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} {self.day}: {self.shows} shows'
+
+
+class PostSeries(models.Model):
+    # Ring buffers of signed 32-bit counts, one slot per hour or day. The
+    # slot of hour h is h % length, and hour/day hold the newest one
+    # written, so slots that fell out of the window are zeroed lazily.
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='series',
+    )
+    hour = models.IntegerField(default=0)
+    day = models.IntegerField(default=0)
+    hourly_shows = models.BinaryField(default=bytes)
+    hourly_votes = models.BinaryField(default=bytes)
+    daily_shows = models.BinaryField(default=bytes)
+    daily_votes = models.BinaryField(default=bytes)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hour'], name='post_series_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} series at hour {self.hour}'
+
+
+class PostScoreBucket(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='score_buckets',
+    )
+    day = models.DateField()
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_post_score_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'post'], name='score_bucket_day_post_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} {self.day}: {self.score}'
+
+
+class PostViewerSketch(models.Model):
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='viewer_sketch',
+    )
+    registers = models.BinaryField()
+    estimate = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.post_id} anonymous viewers: {self.estimate}'
+
+
+class PostViewerSet(models.Model):
+    # Users whose shows of the post were rolled up, as a sorted array of
+    # ids, so a returning viewer is not counted again once the raw row is
+    # gone.
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='viewer_set',
+    )
+    user_ids = models.BinaryField(default=bytes)
+
+    def __str__(self):
+        return f'{self.post_id} rolled up viewers'
+
 
 class Comment(models.Model):
     comment = models.TextField()
@@ -73,10 +288,28 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name='comments',
     )
+    rating = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'create_at'], name='comment_post_create_at_idx'),
+        ]
 
     def __str__(self):
         return f'{self.pk} comment for post: {self.post}'
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        if not created and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = ['comment', 'create_at', 'post', 'user']
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                Post.objects.filter(pk=self.post_id).update(
+                    comment_count=F('comment_count') + 1,
+                    version=F('version') + 1,
+                )
+
 
 class CommentLike(models.Model):
     value = models.IntegerField()
@@ -93,14 +326,71 @@ class CommentLike(models.Model):
         on_delete=models.CASCADE,
         related_name='comment_likes',
     )
+    delta = 0
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['comment', 'user'], name='comment_like_comment_user_unique'),
+        ]
 
     def __str__(self):
         return f'{self.pk} value: {self.value} | {self.comment}'
 
+    @classmethod
+    def vote(cls, comment_id, user_id, value):
+        return cast_vote(cls, value, comment_id=comment_id, user_id=user_id)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.delta = self.value
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.delta:
+                Comment.objects.filter(pk=self.comment_id).update(rating=F('rating') + self.delta)
+        self.delta = 0
+
 
 class Tag(models.Model):
-    title = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, unique=True)
     create_at = models.DateTimeField(auto_now_add=True)
+    post_count = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return f'{self.title}'
+
+
+class OutboundEmail(models.Model):
+    QUEUED = 'queued'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    html_message = models.TextField()
+    from_email = models.CharField(max_length=255, null=True, blank=True)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    create_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} {self.status}: {self.subject} -> {self.recipient}'
+
+
+class ReplicaHeartbeat(models.Model):
+    written_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'heartbeat at {self.written_at}'
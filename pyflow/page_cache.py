@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import hashlib
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.text import compress_string
+
+GENERATION_KEY = 'pyflow:pages:generation'
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def post_generation_key(post_id):
+    return f'pyflow:pages:generation:{post_id}'
+
+
+def _generations(keys):
+    # Generations are seeded from the clock rather than 0, so a counter that
+    # was evicted never restarts at a value old pages were stored under.
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def expire_pages(post_id=None):
+    keys = [GENERATION_KEY]
+    if post_id is not None:
+        keys.append(post_generation_key(post_id))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def page_key(request, post_id):
+    if post_id is None:
+        generations = _generations([GENERATION_KEY])
+    else:
+        generations = _generations([post_generation_key(post_id)])
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"pyflow:page:{':'.join(map(str, generations))}:{path}"
+
+
+def _response(request, entry):
+    if ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(entry['body'], content_type=entry['content_type'])
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(entry['body']), content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_vary_headers(response, ('Cookie', 'Accept-Encoding'))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
+
+
+def _cacheable(request, response):
+    # A page that handed out a CSRF token or touched the session carries a
+    # cookie for this visitor only.
+    if request.META.get('CSRF_COOKIE_USED') or request.session.modified:
+        return False
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def _cached_response(request, post_id, on_hit, args, kwargs):
+    key = page_key(request, post_id)
+    entry = cache.get(key)
+    if entry is None:
+        return key, None
+    if on_hit:
+        on_hit(request, *args, **kwargs)
+    return key, _response(request, entry)
+
+
+def _page_entry(request, response):
+    if not _cacheable(request, response):
+        return None
+    return {
+        'body': compress_string(response.content),
+        'content_type': response['Content-Type'],
+        'etag': quote_etag(f'W/"{hashlib.md5(response.content).hexdigest()}"'),
+        'last_modified': int(time.time()),
+    }
+
+
+def _rendered(request, response, entry):
+    if entry is None:
+        return response
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_vary_headers(response, ('Cookie', 'Accept-Encoding'))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
+
+
+def _store(request, key, response):
+    entry = _page_entry(request, response)
+    if entry is not None:
+        cache.set(key, entry, settings.PYFLOW_PAGE_CACHE_TIMEOUT)
+    return _rendered(request, response, entry)
+
+
+def _coalesced_response(request, view, post_id, on_hit, args, kwargs):
+    # get_or_set lets one request render a missing page while concurrent
+    # ones for the same page wait for it, and a stale page is served while
+    # it is refreshed.
+    rendered = []
+
+    def render():
+        response = view(request, *args, **kwargs)
+        rendered.append(response)
+        return _page_entry(request, response)
+
+    entry = cache.get_or_set(page_key(request, post_id), render, settings.PYFLOW_PAGE_CACHE_TIMEOUT)
+    if rendered:
+        return _rendered(request, rendered[0], entry)
+    if on_hit:
+        on_hit(request, *args, **kwargs)
+    return _response(request, entry)
+
+
+def _is_authenticated(request):
+    return request.user.is_authenticated
+
+
+def anonymous_page_cache(post_kwarg=None, on_hit=None):
+    # Lists only follow the global generation, which every write bumps. A
+    # detail page follows its post's own generation, so writes elsewhere do
+    # not expire it; its related posts and sidebar may then lag by up to
+    # PYFLOW_PAGE_CACHE_TIMEOUT.
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != 'GET' or await sync_to_async(_is_authenticated)(request):
+                    return await view(request, *args, **kwargs)
+                key, response = await sync_to_async(_cached_response)(
+                    request, kwargs.get(post_kwarg) if post_kwarg else None, on_hit, args, kwargs,
+                )
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                return await sync_to_async(_store)(request, key, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or _is_authenticated(request):
+                return view(request, *args, **kwargs)
+            return _coalesced_response(
+                request, view, kwargs.get(post_kwarg) if post_kwarg else None, on_hit, args, kwargs,
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,128 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.http import Http404
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as error:
+        raise InvalidCursor(cursor) from error
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def make_page(rows, per_page, after, before, object_list):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or before:
+            next_cursor = encode_cursor(list(rows[-1][1:]))
+        if (before and has_more) or after:
+            prev_cursor = encode_cursor(list(rows[0][1:]))
+    return KeysetPage(object_list([row[0] for row in rows]), next_cursor, prev_cursor)
+
+
+def ordered_by_ids(queryset, ids):
+    if not ids:
+        return queryset.none()
+    position = Case(*[When(pk=pk, then=Value(i)) for i, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(position)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.per_page = per_page or settings.PYFLOW_PAGE_SIZE
+
+    def decode_cursor(self, cursor):
+        values = decode_cursor(cursor, len(self.fields))
+        # to_python() lets None through, and None cannot be compared in SQL.
+        if None in values:
+            raise InvalidCursor(cursor)
+        try:
+            return [self._field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (TypeError, ValidationError) as error:
+            raise InvalidCursor(cursor) from error
+
+    def page(self, after=None, before=None):
+        ordering = self.ordering
+        queryset = self.queryset
+        if before:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+            queryset = queryset.filter(self._seek(self.decode_cursor(before), ordering))
+        elif after:
+            queryset = queryset.filter(self._seek(self.decode_cursor(after), ordering))
+        rows = list(queryset.order_by(*ordering).values_list('pk', *self.fields)[:self.per_page + 1])
+        return make_page(rows, self.per_page, after, before, self._object_list)
+
+    def _object_list(self, ids):
+        return self.queryset.filter(pk__in=ids).order_by(*self.ordering)
+
+    def _field(self, name):
+        return self.queryset.model._meta.get_field(name)
+
+    def _seek(self, values, ordering):
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+
+def paginate(request, queryset, ordering):
+    return paginate_with(request, KeysetPaginator(queryset, ordering))
+
+
+def paginate_with(request, paginator):
+    try:
+        page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    page.next_url = _page_url(request, 'after', page.next_cursor)
+    page.prev_url = _page_url(request, 'before', page.prev_cursor)
+    return page
+
+
+def _page_url(request, key, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[key] = cursor
+    return f'?{query.urlencode()}'
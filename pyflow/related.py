@@ -0,0 +1,35 @@
+import math
+
+from django.conf import settings
+from django.db.models import Case, FloatField, Max, Sum, Value, When
+
+from pyflow.models import Post
+
+
+def tag_weights(post):
+    # Tag.post_count is the document frequency of each tag's posting list
+    # (the Post.tags through table); the highest post id stands in for the
+    # corpus size, which only shifts all weights together.
+    tags = list(post.tags.values_list('id', 'post_count'))
+    if not tags:
+        return {}
+    total = Post.objects.aggregate(total=Max('id'))['total'] or 1
+    rare = [(pk, count) for pk, count in tags if count <= settings.PYFLOW_RELATED_MAX_TAG_POSTS]
+    return {pk: math.log(1 + total / max(count, 1)) for pk, count in rare or tags}
+
+
+def related_posts(post, limit=None):
+    weights = tag_weights(post)
+    if not weights:
+        return Post.objects.none()
+
+    def score(tag_field):
+        cases = [When(**{tag_field: pk}, then=Value(weight)) for pk, weight in weights.items()]
+        return Sum(Case(*cases, output_field=FloatField()))
+
+    postings = Post.tags.through.objects.filter(tag_id__in=list(weights)).exclude(post_id=post.pk)
+    top = postings.values('post_id').annotate(score=score('tag_id')).order_by('-score', '-post_id')
+    top = top.values('post_id')[:limit or settings.PYFLOW_RELATED_POSTS]
+    return Post.objects.filter(pk__in=top, tags__in=list(weights)).annotate(
+        score=score('tags__id'),
+    ).order_by('-score', '-id')
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.utils import timezone
+
+from pyflow.models import ReplicaHeartbeat
+
+PIN_COOKIE = 'pyflow_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The alias reads go to for the current request; None means the primary.
+read_alias = contextvars.ContextVar('pyflow_read_alias', default=None)
+
+_health = {}
+
+
+def write_heartbeat():
+    ReplicaHeartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(pk=1, defaults={'written_at': timezone.now()})
+
+
+def replica_lag(alias):
+    written_at = ReplicaHeartbeat.objects.using(alias).filter(pk=1).values_list('written_at', flat=True).first()
+    if written_at is None:
+        return None
+    return (timezone.now() - written_at).total_seconds()
+
+
+def is_healthy(alias):
+    # A replica whose last heartbeat is older than PYFLOW_REPLICA_MAX_LAG, or
+    # which cannot be queried, is skipped until the next check.
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < settings.PYFLOW_REPLICA_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        lag = None
+    healthy = lag is not None and lag <= settings.PYFLOW_REPLICA_MAX_LAG
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def forget_health():
+    _health.clear()
+
+
+def choose_replica():
+    replicas = [alias for alias in settings.PYFLOW_REPLICAS if is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@contextmanager
+def use_primary():
+    # For reads that decide what gets written, such as a flush during a GET,
+    # which must not see a lagging replica.
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def copy_database(source, name):
+    # Stands in for replication locally: the SQLite online backup API copies
+    # a consistent snapshot while the primary stays writable.
+    source.ensure_connection()
+    target = sqlite3.connect(str(name))
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'sessions':
+            return DEFAULT_DB_ALIAS
+        return read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return db not in settings.PYFLOW_REPLICAS
+
+
+class ReplicaMiddleware:
+    # Safe requests read from a healthy replica. A write pins the visitor to
+    # the primary for PYFLOW_REPLICA_PIN_SECONDS, so they read their own
+    # writes while the replicas catch up.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = read_alias.set(self.alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        alias = await sync_to_async(self.alias)(request) if settings.PYFLOW_REPLICAS else None
+        token = read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.pin(request, response)
+
+    def alias(self, request):
+        if not settings.PYFLOW_REPLICAS or request.method not in SAFE_METHODS or is_pinned(request):
+            return None
+        return choose_replica()
+
+    def pin(self, request, response):
+        if settings.PYFLOW_REPLICAS and request.method not in SAFE_METHODS:
+            seconds = settings.PYFLOW_REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+        return response
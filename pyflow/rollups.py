@@ -0,0 +1,98 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from pyflow.models import PostShow, PostShowDaily, PostViewerSet
+
+TYPECODE = 'q'
+
+
+def rollup_cutoff(days=None):
+    # Whole days only, so a day is never split between a rollup and the tail.
+    day = timezone.localdate() - timedelta(days=settings.PYFLOW_ROLLUP_DAYS if days is None else days)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup_show_batch(before, batch_size):
+    # Every batch folds and deletes its rows in one transaction, so an
+    # interrupted run loses nothing and the next one carries on from there.
+    with transaction.atomic():
+        ids = list(
+            PostShow.objects.filter(create_at__lt=before).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        rows = PostShow.objects.filter(id__in=ids, post__isnull=False).annotate(
+            day=TruncDate('create_at'),
+        ).values('post_id', 'day').annotate(shows=Count('id')).order_by()
+        totals = {(row['post_id'], row['day']): row['shows'] for row in rows}
+        existing = Q()
+        for post_id, day in totals:
+            existing |= Q(post_id=post_id, day=day)
+        updated = []
+        if totals:
+            for daily in PostShowDaily.objects.select_for_update().filter(existing):
+                daily.shows += totals.pop((daily.post_id, daily.day))
+                updated.append(daily)
+        PostShowDaily.objects.bulk_update(updated, ['shows'])
+        PostShowDaily.objects.bulk_create(
+            [PostShowDaily(post_id=post_id, day=day, shows=shows) for (post_id, day), shows in totals.items()],
+        )
+        viewers = defaultdict(set)
+        pairs = PostShow.objects.filter(id__in=ids, post__isnull=False, user__isnull=False).values_list(
+            'post_id', 'user_id',
+        )
+        for post_id, user_id in pairs:
+            viewers[post_id].add(user_id)
+        add_viewers(viewers)
+        PostShow.objects.filter(id__in=ids).delete()
+        return len(ids)
+
+
+def add_viewers(viewers):
+    stored = PostViewerSet.objects.select_for_update().in_bulk(list(viewers))
+    updated, created = [], []
+    for post_id, user_ids in viewers.items():
+        row = stored.get(post_id)
+        if row is None:
+            row = PostViewerSet(post_id=post_id)
+            created.append(row)
+        else:
+            updated.append(row)
+        merged = user_ids.union(array(TYPECODE, bytes(row.user_ids)))
+        row.user_ids = array(TYPECODE, sorted(merged)).tobytes()
+    PostViewerSet.objects.bulk_update(updated, ['user_ids'])
+    PostViewerSet.objects.bulk_create(created)
+
+
+def rolled_up_viewers(users):
+    # The (post, user) pairs out of `users`, a set of user ids per post,
+    # whose shows have been rolled up.
+    seen = set()
+    for post_id, data in PostViewerSet.objects.filter(post_id__in=users).values_list('post_id', 'user_ids'):
+        user_ids = array(TYPECODE, bytes(data))
+        for user_id in users[post_id]:
+            index = bisect_left(user_ids, user_id)
+            if index < len(user_ids) and user_ids[index] == user_id:
+                seen.add((post_id, user_id))
+    return seen
+
+
+def rollup_shows(days=None, batch_size=None, max_batches=None):
+    before = rollup_cutoff(days)
+    batch_size = batch_size or settings.PYFLOW_ROLLUP_BATCH_SIZE
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        folded = rollup_show_batch(before, batch_size)
+        if not folded:
+            break
+        total += folded
+        batches += 1
+    return total
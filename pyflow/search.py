@@ -0,0 +1,101 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from pyflow.feed import feed_queryset
+from pyflow.models import Post
+from pyflow.pagination import InvalidCursor, KeysetPage, KeysetPaginator, decode_cursor, make_page, ordered_by_ids
+
+FTS_TABLE = 'pyflow_post_fts'
+
+TRIGGERS_SQL = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON pyflow_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON pyflow_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON pyflow_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+]
+
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available(using=connection):
+    if using.vendor != 'sqlite':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def install_search_index(using=connection):
+    # Django rebuilds SQLite tables on ALTER, which drops their triggers;
+    # this is re-run after every migrate to put them back.
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                       [f'{FTS_TABLE}_%'])
+        if cursor.fetchone()[0] == len(TRIGGERS_SQL):
+            return
+        for sql in TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(REBUILD_SQL)
+
+
+def match_expression(query):
+    words = WORD_RE.findall(query.lower())
+    return ' OR '.join(f'"{word}"*' for word in dict.fromkeys(words))
+
+
+class SearchPaginator:
+    def __init__(self, query, per_page=None):
+        self.match = match_expression(query)
+        self.per_page = per_page or settings.PYFLOW_PAGE_SIZE
+
+    def decode_cursor(self, cursor):
+        rank, pk = decode_cursor(cursor, 2)
+        try:
+            return float(rank), int(pk)
+        except (TypeError, ValueError) as error:
+            raise InvalidCursor(cursor) from error
+
+    def page(self, after=None, before=None):
+        if not self.match:
+            return KeysetPage(Post.objects.none())
+        if not fts_available():
+            return self._fallback_page(after, before)
+        sql = f'SELECT rowid, rank, rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [self.match]
+        if before:
+            rank, pk = self.decode_cursor(before)
+            sql += ' AND (rank < %s OR (rank = %s AND rowid < %s)) ORDER BY rank DESC, rowid DESC'
+            params += [rank, rank, pk]
+        elif after:
+            rank, pk = self.decode_cursor(after)
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s)) ORDER BY rank, rowid'
+            params += [rank, rank, pk]
+        else:
+            sql += ' ORDER BY rank, rowid'
+        sql += ' LIMIT %s'
+        params.append(self.per_page + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return make_page(rows, self.per_page, after, before, self._object_list)
+
+    def _object_list(self, ids):
+        return ordered_by_ids(feed_queryset(), ids)
+
+    def _fallback_page(self, after, before):
+        condition = Q()
+        for word in WORD_RE.findall(self.match):
+            condition |= Q(title__icontains=word) | Q(content__icontains=word)
+        paginator = KeysetPaginator(feed_queryset().filter(condition), ('-create_at', '-id'), self.per_page)
+        return paginator.page(after=after, before=before)
@@ -0,0 +1,137 @@
+from array import array
+from datetime import date, datetime
+
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from pyflow.models import Post, PostSeries
+from pyflow.replicas import use_primary
+
+TYPECODE = 'i'
+KINDS = ('shows', 'votes')
+SERIES_FIELDS = ('hour', 'day', 'hourly_shows', 'hourly_votes', 'daily_shows', 'daily_votes')
+TRENDING_KEY = 'pyflow:trending'
+# A vote is a stronger signal than a view.
+VOTE_WEIGHT = 5
+
+
+def hour_number(now=None):
+    return int((now or timezone.now()).timestamp() // 3600)
+
+
+def day_number(now=None):
+    return timezone.localdate(now).toordinal()
+
+
+def load(data, length):
+    values = array(TYPECODE, bytes(data))
+    if len(values) != length:
+        # New, or the length setting changed and the slots no longer line up.
+        return array(TYPECODE, bytes(values.itemsize * length))
+    return values
+
+
+def advance(values, newest, current):
+    # The slots between the newest number written and the current one still
+    # hold counts from a lap ago.
+    length = len(values)
+    for number in range(newest + 1, min(current, newest + length) + 1):
+        values[number % length] = 0
+
+
+def window(values, newest, current, count):
+    # The `count` slots up to `current`, oldest first.
+    length = len(values)
+    return [
+        values[number % length] if newest - length < number <= newest else 0
+        for number in range(current - count + 1, current + 1)
+    ]
+
+
+def _add(row, resolution, pointer, current, length, kind, count):
+    newest = getattr(row, pointer)
+    if current <= newest - length:
+        return
+    buffers = {name: load(getattr(row, f'{resolution}_{name}'), length) for name in KINDS}
+    if current > newest:
+        for values in buffers.values():
+            advance(values, newest, current)
+        setattr(row, pointer, current)
+    buffers[kind][current % length] += count
+    for name, values in buffers.items():
+        setattr(row, f'{resolution}_{name}', values.tobytes())
+
+
+def record_series(counts, kind, now=None):
+    counts = {post_id: count for post_id, count in counts.items() if count}
+    if not counts:
+        return
+    hour, day = hour_number(now), day_number(now)
+    with use_primary(), transaction.atomic():
+        rows = PostSeries.objects.select_for_update().in_bulk(list(counts))
+        missing = [post_id for post_id in counts if post_id not in rows]
+        if missing:
+            live = Post.objects.filter(pk__in=missing).values_list('pk', flat=True)
+            PostSeries.objects.bulk_create([PostSeries(post_id=post_id) for post_id in live], ignore_conflicts=True)
+            rows.update(PostSeries.objects.select_for_update().in_bulk(missing))
+        for post_id, row in rows.items():
+            _add(row, 'hourly', 'hour', hour, settings.PYFLOW_SERIES_HOURS, kind, counts[post_id])
+            _add(row, 'daily', 'day', day, settings.PYFLOW_SERIES_DAYS, kind, counts[post_id])
+        PostSeries.objects.bulk_update(list(rows.values()), SERIES_FIELDS)
+
+
+def post_series(post_id, now=None):
+    hour, day = hour_number(now), day_number(now)
+    hours, days = settings.PYFLOW_SERIES_HOURS, settings.PYFLOW_SERIES_DAYS
+    row = PostSeries.objects.filter(pk=post_id).first() or PostSeries(post_id=post_id)
+    return {
+        'hourly': {
+            'start': datetime.fromtimestamp((hour - hours + 1) * 3600, tz=pytz.UTC).isoformat(),
+            **{name: window(load(getattr(row, f'hourly_{name}'), hours), row.hour, hour, hours) for name in KINDS},
+        },
+        'daily': {
+            'start': date.fromordinal(day - days + 1).isoformat(),
+            **{name: window(load(getattr(row, f'daily_{name}'), days), row.day, day, days) for name in KINDS},
+        },
+    }
+
+
+def trending(now=None):
+    # Only posts written to in the current or previous hour can be trending,
+    # and the hour index keeps the scan to those, however long the event
+    # history is. Growth compares the last 60 minutes with the hourly
+    # average of the baseline before them.
+    now = now or timezone.now()
+    hour = hour_number(now)
+    hours, baseline = settings.PYFLOW_SERIES_HOURS, settings.PYFLOW_TRENDING_BASELINE_HOURS
+    # The current hour is partial, so the previous one makes up the rest.
+    carried = 1 - now.timestamp() % 3600 / 3600
+    rows = PostSeries.objects.filter(hour__gte=hour - 1).values_list('post_id', 'hour', 'hourly_shows', 'hourly_votes')
+    board = []
+    for post_id, newest, shows, votes in rows:
+        activity = [
+            show + VOTE_WEIGHT * max(vote, 0)
+            for show, vote in zip(
+                window(load(shows, hours), newest, hour, baseline + 2),
+                window(load(votes, hours), newest, hour, baseline + 2),
+            )
+        ]
+        recent = activity[-1] + activity[-2] * carried
+        if recent < settings.PYFLOW_TRENDING_MIN_ACTIVITY:
+            continue
+        average = sum(activity[:-2]) / baseline
+        board.append({
+            'post_id': post_id,
+            'growth': (recent + 1) / (average + 1),
+            'recent': recent,
+            'baseline': average,
+        })
+    board.sort(key=lambda entry: (-entry['growth'], -entry['recent'], -entry['post_id']))
+    return board[:settings.PYFLOW_TRENDING_SIZE]
+
+
+def trending_posts():
+    return cache.get_or_set(TRENDING_KEY, trending, settings.PYFLOW_TRENDING_TIMEOUT)
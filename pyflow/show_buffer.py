@@ -0,0 +1,143 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q
+
+from accounts.stats import bump_user_stats
+from pyflow.hyperloglog import HyperLogLog
+from pyflow.models import Post, PostShow, PostViewerSketch
+from pyflow.replicas import use_primary
+from pyflow.rollups import rolled_up_viewers
+from pyflow.series import record_series
+
+logger = logging.getLogger(__name__)
+
+
+class ShowBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pairs = set()
+        self.sketches = {}
+        self.last_flush = time.monotonic()
+
+    def add(self, post_id, user_id):
+        with self.lock:
+            self.pairs.add((post_id, user_id))
+        self.maybe_flush()
+
+    def add_anonymous(self, post_id, visitor):
+        with self.lock:
+            self.sketches.setdefault(post_id, HyperLogLog()).add(visitor)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        size = len(self.pairs) + len(self.sketches)
+        if size >= settings.PYFLOW_SHOW_BUFFER_SIZE or \
+                time.monotonic() - self.last_flush >= settings.PYFLOW_SHOW_FLUSH_INTERVAL:
+            # The flush runs on a request thread, whose page should not fail
+            # because the shows it buffered could not be written yet.
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Could not flush buffered post shows; keeping them for the next flush')
+
+    def clear(self):
+        with self.lock:
+            self.pairs, self.sketches = set(), {}
+            self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            pairs, self.pairs = self.pairs, set()
+            sketches, self.sketches = self.sketches, {}
+            self.last_flush = time.monotonic()
+        shows = Counter()
+        try:
+            with use_primary(), transaction.atomic():
+                if pairs:
+                    shows.update(self._flush_shows(pairs))
+                if sketches:
+                    shows.update(self._flush_sketches(sketches))
+                record_series(shows, 'shows')
+        except DatabaseError:
+            self._restore(pairs, sketches)
+            raise
+        return len(pairs), len(sketches)
+
+    def _restore(self, pairs, sketches):
+        with self.lock:
+            self.pairs |= pairs
+            for post_id, sketch in sketches.items():
+                if post_id in self.sketches:
+                    sketch.merge(self.sketches[post_id])
+                self.sketches[post_id] = sketch
+
+    def _flush_shows(self, pairs):
+        users = defaultdict(set)
+        for post_id, user_id in pairs:
+            users[post_id].add(user_id)
+        existing = Q()
+        for post_id, user_ids in users.items():
+            existing |= Q(post_id=post_id, user_id__in=user_ids)
+        seen = set(PostShow.objects.filter(existing).values_list('post_id', 'user_id'))
+        seen |= rolled_up_viewers(users)
+        owners = dict(Post.objects.filter(pk__in=users).values_list('pk', 'user_id'))
+        new = [(post_id, user_id) for post_id, user_id in pairs if post_id in owners and (post_id, user_id) not in seen]
+        PostShow.objects.bulk_create([PostShow(post_id=post_id, user_id=user_id) for post_id, user_id in new])
+        by_delta = defaultdict(list)
+        for post_id, delta in Counter(post_id for post_id, _ in new).items():
+            by_delta[delta].append(post_id)
+        for delta, post_ids in by_delta.items():
+            Post.objects.filter(pk__in=post_ids).update(
+                show_count=F('show_count') + delta,
+                version=F('version') + 1,
+            )
+        for owner_id, delta in Counter(owners[post_id] for post_id, _ in new).items():
+            bump_user_stats(owner_id, posts_shows=delta)
+        return Counter(post_id for post_id, _ in new)
+
+    def _flush_sketches(self, sketches):
+        stored = PostViewerSketch.objects.in_bulk(list(sketches))
+        live = set(Post.objects.filter(pk__in=sketches).values_list('pk', flat=True))
+        updated, created = [], []
+        # The series count the estimated new viewers, like the shows above.
+        viewers = {}
+        for post_id, sketch in sketches.items():
+            if post_id not in live:
+                continue
+            row = stored.get(post_id)
+            if row is None:
+                row = PostViewerSketch(post_id=post_id)
+                created.append(row)
+            else:
+                sketch.merge(HyperLogLog(row.registers))
+                updated.append(row)
+            estimate = sketch.count()
+            viewers[post_id] = max(estimate - row.estimate, 0)
+            row.registers = sketch.to_bytes()
+            row.estimate = estimate
+        PostViewerSketch.objects.bulk_update(updated, ['registers', 'estimate'])
+        PostViewerSketch.objects.bulk_create(created, ignore_conflicts=True)
+        return viewers
+
+
+def visitor_key(request):
+    if request.session.session_key:
+        return request.session.session_key
+    return f"{request.META.get('REMOTE_ADDR')}|{request.META.get('HTTP_USER_AGENT', '')}"
+
+
+show_buffer = ShowBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        show_buffer.flush()
+    except DatabaseError:
+        logger.exception('Could not flush buffered post shows on exit')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from pyflow.models import Tag
+
+POPULAR_TAGS_KEY = 'pyflow:popular_tags'
+
+
+def _load_popular_tags():
+    ordering = ('-post_count', 'id')
+    ids = list(Tag.objects.order_by(*ordering).values_list('id', flat=True)[:settings.PYFLOW_SIDEBAR_TAGS])
+    tags = Tag.objects.filter(id__in=ids).order_by(*ordering)
+    len(tags)
+    return tags
+
+
+def popular_tags():
+    return cache.get_or_set(POPULAR_TAGS_KEY, _load_popular_tags, settings.PYFLOW_SIDEBAR_TIMEOUT)
+
+
+def invalidate_popular_tags():
+    cache.delete(POPULAR_TAGS_KEY)
@@ -0,0 +1,112 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from pyflow.leaderboards import record_vote
+from pyflow.models import Comment, CommentLike, Post, PostLike, Tag
+from pyflow.page_cache import expire_pages
+from pyflow.series import record_series
+from pyflow.sidebar import invalidate_popular_tags
+from pyflow.tags_creator import tag_cache, tag_index
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_tag_post_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_post_ids = list(instance.posts.values_list('id', flat=True))
+        else:
+            instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        if reverse:
+            post_ids = instance._cleared_post_ids
+            Tag.objects.filter(pk=instance.pk).update(post_count=F('post_count') - len(post_ids))
+        else:
+            post_ids = [instance.pk]
+            Tag.objects.filter(pk__in=instance._cleared_tag_ids).update(post_count=F('post_count') - 1)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        delta = 1 if action == 'post_add' else -1
+        if reverse:
+            post_ids = pk_set
+            Tag.objects.filter(pk=instance.pk).update(post_count=F('post_count') + delta * len(pk_set))
+        else:
+            post_ids = [instance.pk]
+            Tag.objects.filter(pk__in=pk_set).update(post_count=F('post_count') + delta)
+    else:
+        return
+    Post.objects.filter(pk__in=post_ids).update(version=F('version') + 1)
+    for post_id in post_ids:
+        expire_pages(post_id)
+    invalidate_popular_tags()
+
+
+@receiver(pre_delete, sender=Post)
+def release_post_tags(sender, instance, **kwargs):
+    if Tag.objects.filter(posts=instance).update(post_count=F('post_count') - 1):
+        invalidate_popular_tags()
+
+
+@receiver(pre_delete, sender=Tag)
+def drop_deleted_tag(sender, instance, **kwargs):
+    tag_cache.discard(instance.title)
+    tag_index.discard(instance.title)
+    Post.objects.filter(tags=instance).update(version=F('version') + 1)
+    expire_pages()
+    invalidate_popular_tags()
+
+
+@receiver(post_save, sender=PostLike)
+def score_post_vote(sender, instance, **kwargs):
+    if instance.delta:
+        record_vote(instance.post_id, instance.score_changes)
+        record_series({instance.post_id: instance.delta}, 'votes')
+
+
+# Deletes are counted in delete receivers rather than delete() overrides, so
+# cascades (a deleted user's votes and comments) and queryset deletes (the
+# admin) adjust the counters too. They run on pre_delete, when every row of
+# a cascade is still there to be read: the collector may delete a parent
+# before its children.
+@receiver(pre_delete, sender=Comment)
+def release_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        comment_count=F('comment_count') - 1,
+        version=F('version') + 1,
+    )
+
+
+@receiver(pre_delete, sender=PostLike)
+def release_post_vote(sender, instance, **kwargs):
+    if instance.value and instance.post_id:
+        Post.objects.filter(pk=instance.post_id).update(
+            rating=F('rating') - instance.value,
+            version=F('version') + 1,
+        )
+        record_vote(instance.post_id, {instance.score_day: -instance.value})
+
+
+@receiver(pre_delete, sender=CommentLike)
+def release_comment_vote(sender, instance, **kwargs):
+    if instance.value and instance.comment_id:
+        Comment.objects.filter(pk=instance.comment_id).update(rating=F('rating') - instance.value)
+
+
+# Shows are left out on purpose: expiring a page on every view would
+# defeat the page cache, so show counts may lag by the page timeout.
+@receiver([post_save, post_delete], sender=Post)
+def expire_post_pages(sender, instance, **kwargs):
+    expire_pages(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=PostLike)
+def expire_post_child_pages(sender, instance, **kwargs):
+    expire_pages(instance.post_id)
+
+
+@receiver([post_save, pre_delete], sender=CommentLike)
+def expire_comment_vote_pages(sender, instance, **kwargs):
+    post_id = Comment.objects.filter(pk=instance.comment_id).values_list('post_id', flat=True).first()
+    if post_id is not None:
+        expire_pages(post_id)
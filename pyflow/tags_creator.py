@@ -1,15 +1,162 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
 from pyflow.models import Tag
 
+# Prefixes up to this long match so many tags that their ranked results are
+# kept until the index next changes.
+MEMO_PREFIX_LENGTH = 2
+
+
+class TagCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = OrderedDict()
+
+    def get_many(self, titles):
+        found = {}
+        with self.lock:
+            for title in titles:
+                if title in self.ids:
+                    self.ids.move_to_end(title)
+                    found[title] = self.ids[title]
+        return found
+
+    def set_many(self, ids):
+        with self.lock:
+            for title, pk in ids.items():
+                self.ids[title] = pk
+                self.ids.move_to_end(title)
+            while len(self.ids) > settings.PYFLOW_TAG_CACHE_SIZE:
+                self.ids.popitem(last=False)
+
+    def discard(self, title):
+        with self.lock:
+            self.ids.pop(title, None)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+
+tag_cache = TagCache()
+
+
+class TagIndex:
+    # Titles are kept sorted, so the tags starting with a prefix are one
+    # bisected slice. The index is loaded on first use, takes tags created
+    # or deleted in this process straight away and is reloaded every
+    # PYFLOW_TAG_INDEX_REFRESH seconds for those from other processes and
+    # for the post counts it ranks by.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.titles = []
+            self.tags = {}
+            self.memo = {}
+            self.loaded_at = None
+
+    def _load(self):
+        tags = {title: (pk, post_count) for pk, title, post_count in Tag.objects.values_list('id', 'title', 'post_count')}
+        with self.lock:
+            self.titles = sorted(tags)
+            self.tags = tags
+            self.memo = {}
+            self.loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= settings.PYFLOW_TAG_INDEX_REFRESH:
+            self._load()
+
+    def add_many(self, ids):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            for title, pk in ids.items():
+                if title not in self.tags:
+                    bisect.insort(self.titles, title)
+                    self.tags[title] = (pk, 0)
+            self.memo = {}
+
+    def discard(self, title):
+        with self.lock:
+            if self.tags.pop(title, None) is not None:
+                del self.titles[bisect.bisect_left(self.titles, title)]
+                self.memo = {}
+
+    def _ranked(self, prefix, size):
+        start = bisect.bisect_left(self.titles, prefix)
+        end = bisect.bisect_left(self.titles, prefix + '\U0010ffff', start)
+        return heapq.nsmallest(size, self.titles[start:end], key=lambda title: (-self.tags[title][1], title))
+
+    def complete(self, prefix, limit):
+        prefix = normalize_tag(prefix).lstrip('#')
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        with self.lock:
+            if len(prefix) <= MEMO_PREFIX_LENGTH and limit <= settings.PYFLOW_API_MAX_LIMIT:
+                matches = self.memo.get(prefix)
+                if matches is None:
+                    matches = self.memo[prefix] = self._ranked(prefix, settings.PYFLOW_API_MAX_LIMIT)
+            else:
+                matches = self._ranked(prefix, limit)
+            return [
+                {'id': self.tags[title][0], 'title': title, 'post_count': self.tags[title][1]}
+                for title in matches[:limit]
+            ]
+
+
+tag_index = TagIndex()
+
+
+def normalize_tag(title):
+    return title.strip().lower()
+
+
+def parse_tags(data):
+    titles = (normalize_tag(title) for title in data[1:].replace(' ', '').split('#'))
+    return list(dict.fromkeys(title for title in titles if title))
+
 
 def tags_creator(data):
-    tags = []
-    for tag_title in data[1:].replace(' ', '').split('#'):
-        tag = Tag.objects.filter(title=tag_title).first()
-        if tag:
-            tags.append(tag)
-        elif tag is None:
-            tags.append(Tag.objects.create(title=tag_title))
-    return tags
+    titles = parse_tags(data)
+    ids = tag_cache.get_many(titles)
+    missing = [title for title in titles if title not in ids]
+    if missing:
+        found = dict(Tag.objects.filter(title__in=missing).values_list('title', 'id'))
+        new = [title for title in missing if title not in found]
+        if new:
+            Tag.objects.bulk_create([Tag(title=title) for title in new], ignore_conflicts=True)
+            created = dict(Tag.objects.filter(title__in=new).values_list('title', 'id'))
+            tag_index.add_many(created)
+            found.update(created)
+        tag_cache.set_many(found)
+        ids.update(found)
+    return [Tag.from_db(Tag.objects.db, ['id', 'title'], [ids[title], title]) for title in titles]
+
+
+def set_post_tags(post, data):
+    # A cached id may belong to a tag another process has deleted since, and
+    # the post's rows for it then fail their foreign key. The titles are
+    # resolved again from the database and the tags set once more.
+    try:
+        with transaction.atomic():
+            post.tags.set(tags_creator(data))
+    except IntegrityError:
+        for title in parse_tags(data):
+            tag_cache.discard(title)
+        post.tags.set(tags_creator(data))
 
 
 def tags_to_string(data):
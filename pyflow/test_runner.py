@@ -0,0 +1,26 @@
+import copy
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    # The shared cache tier is a directory every process on the host uses.
+    # Tests swap it for memory of their own, so they neither wipe the cache
+    # of a server running next to them nor see each other's entries when run
+    # with --parallel.
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = copy.deepcopy(settings.CACHES)
+        caches['shared'] = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pyflow-tests-shared',
+        }
+        self.shared_cache = override_settings(CACHES=caches)
+        self.shared_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.shared_cache.disable()
+        super().teardown_test_environment(**kwargs)
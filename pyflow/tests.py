@@ -1,17 +1,72 @@
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
 from django.core import mail
-from django.test import TestCase
-from django.db.models import QuerySet
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.contrib.sessions.models import Session
+from django.core.management.base import CommandError
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.db.models import QuerySet, Sum
+from io import StringIO
 import pytz
 from datetime import datetime as dt, timedelta
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+import json
+import socketserver
+import threading
 
+from accounts.models import UserStats
+from pyflow import async_views, views
+from pyflow.cache_backends import MemoryCappedLocMemCache, SharedFileCache, TieredCache
 from pyflow.forms import CommentForm, PostForm, SendEmailForm
-from pyflow.models import Post, Tag, PostLike, PostShow, Comment, CommentLike
-from pyflow.tags_creator import tags_creator, tags_to_string
+from pyflow.hyperloglog import HyperLogLog
+from pyflow.leaderboards import top_posts, window_scores
+from pyflow.management.commands.benchmark_async import urlconf
+from pyflow.mail_queue import send_batch
+from pyflow.metrics import MetricsRegistry, registry
+from pyflow.models import (
+    Post, Tag, PostLike, PostShow, Comment, CommentLike, PostViewerSketch, OutboundEmail, PostScoreBucket,
+    PostShowDaily, ReplicaHeartbeat, hot_score,
+)
+from pyflow.pagination import encode_cursor
+from pyflow.related import related_posts
+from pyflow.replicas import (
+    PIN_COOKIE, ReplicaMiddleware, copy_database, forget_health, is_healthy, read_alias, write_heartbeat,
+)
+from pyflow.sidebar import popular_tags
+from pyflow.show_buffer import ShowBuffer, show_buffer
+from pyflow.rollups import rollup_cutoff, rollup_shows
+from pyflow.series import post_series, record_series, trending
+from pyflow.search import fts_available, install_search_index, match_expression
+from pyflow.tags_creator import parse_tags, tag_cache, tag_index, tags_creator, tags_to_string
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
 
 
 class ViewTestCase(TestCase):
     def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
         self.user_1 = User.objects.create_user(username='user1')
         self.user_2 = User.objects.create_user(username='user2')
         self.tag_1 = Tag.objects.create(title='tag1')
@@ -228,7 +283,7 @@ class ViewTestCase(TestCase):
         self.assertEqual(comment_2.user, self.comment_2.user)
         self.assertEqual(comment_2.create_at, self.comment_2.create_at)
         self.assertEqual(comment_1.rating, 1)
-        self.assertEqual(comment_2.rating, None)
+        self.assertEqual(comment_2.rating, 0)
         self.assertEqual(list(comments), [self.comment_1, self.comment_2])
         self.assertIn('form', response.context)
         self.assertIsInstance(response.context['form'], CommentForm)
@@ -241,16 +296,30 @@ class ViewTestCase(TestCase):
         self.assertEqual(post_2.title, self.post_2.title)
         self.assertIn('liked_post_by_user', response.context)
         self.assertTrue(response.context['liked_post_by_user'])
-        self.assertIn('comment_add_or_comment_like_by_user', response.context)
-        comment_add_or_comment_like_by_user = response.context['comment_add_or_comment_like_by_user']
-        self.assertIn(self.comment_1, comment_add_or_comment_like_by_user)
-        comment_1 = comment_add_or_comment_like_by_user[0]
-        self.assertEqual(comment_1.comment, self.comment_1.comment)
-        self.assertEqual(comment_1.user, self.comment_1.user)
-        self.assertEqual(comment_1.post, self.comment_1.post)
+        self.assertIn('voted_comment_ids', response.context)
+        voted_comment_ids = response.context['voted_comment_ids']
+        self.assertIsInstance(voted_comment_ids, set)
+        self.assertEqual(voted_comment_ids, {self.comment_1.pk})
         self.assertEqual(self.post_1.shows.count(), post_1.shows.count())
         self.assertEqual(post_1.shows.count(), 2)
 
+    def test_view_detail_voted_comments_query_count(self):
+        self.client.force_login(self.user_1)
+        self.client.get(f'/post/{self.post_1.pk}')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(f'/post/{self.post_1.pk}')
+        voted = {self.comment_1.pk}
+        for i in range(10):
+            comment = Comment.objects.create(comment=f'comment {i}', post=self.post_1, user=self.user_2)
+            CommentLike.objects.create(value=1, comment=comment, user=self.user_2)
+            if i % 2:
+                CommentLike.objects.create(value=1, comment=comment, user=self.user_1)
+                voted.add(comment.pk)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(f'/post/{self.post_1.pk}')
+        self.assertEqual(len(before), len(after))
+        self.assertEqual(response.context['voted_comment_ids'], voted)
+
     def test_detail_view_get_without_tags(self):
         self.post_3 = Post.objects.create(
             title='title 3', content='content 3', content_code='content code 3', user=self.user_1
@@ -277,7 +346,7 @@ class ViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('liked_post_by_user', response.context)
         self.assertFalse(response.context['liked_post_by_user'])
-        self.assertNotIn('comment_add_or_comment_like_by_user', response.context)
+        self.assertNotIn('voted_comment_ids', response.context)
         post_1 = response.context['post']
         self.assertEqual(self.post_1, post_1)
         self.assertEqual(post_1.shows.count(), self.post_1.shows.count())
@@ -288,6 +357,7 @@ class ViewTestCase(TestCase):
         self.assertEqual(self.post_2.shows.count(), 1)
         response = self.client.get(f'/post/{self.post_2.pk}', {'pk': self.post_2.pk})
         self.assertEqual(response.status_code, 200)
+        show_buffer.flush()
         post_2 = response.context['post']
         self.assertEqual(self.post_2, post_2)
         self.assertEqual(post_2.shows.count(), self.post_2.shows.count())
@@ -667,8 +737,13 @@ class ViewTestCase(TestCase):
                                                                      'receiver': receiver,
                                                                      'topic': topic})
         self.assertRedirects(response, f'/post/{self.post_1.pk}', 302, fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.QUEUED)
+        call_command('send_queued_mail', stdout=StringIO())
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, topic)
+        self.assertEqual(mail.outbox[0].to, [receiver])
+        self.assertIn(self.post_1.title, mail.outbox[0].alternatives[0][0])
 
     def test_send_post_by_email_view_404(self):
         self.client.force_login(self.user_1)
@@ -732,7 +807,7 @@ class ViewTestCase(TestCase):
     def test_search_posts_view_get(self):
         kw_1 = self.post_1.title
         kw_2 = self.post_2.content
-        key_words = f'{kw_1[3:]} {kw_2[2:]}'
+        key_words = f'{kw_1} {kw_2}'
         response = self.client.get('/search/', {'q': key_words})
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'posts_content.html')
@@ -752,3 +827,1677 @@ class ViewTestCase(TestCase):
     def test_search_posts_view_post(self):
         response = self.client.post('/search/', {'q': 'qqq'})
         self.assertRedirects(response, '/', 302, fetch_redirect_response=False)
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create_user(username='user1')
+        self.user_2 = User.objects.create_user(username='user2')
+        self.user_3 = User.objects.create_user(username='user3')
+        self.post_1 = Post.objects.create(
+            title='title1', content='content1', content_code='content_code1', user=self.user_1
+        )
+        PostLike.objects.create(value=1, post=self.post_1, user=self.user_1)
+        PostLike.objects.create(value=-1, post=self.post_1, user=self.user_2)
+        PostLike.objects.create(value=1, post=self.post_1, user=self.user_3)
+        PostShow.objects.create(post=self.post_1, user=self.user_1)
+        self.comment_1 = Comment.objects.create(comment='comment 1', post=self.post_1, user=self.user_1)
+        self.comment_2 = Comment.objects.create(comment='comment 2', post=self.post_1, user=self.user_2)
+        CommentLike.objects.create(value=-1, comment=self.comment_1, user=self.user_2)
+
+    def test_counters_follow_writes(self):
+        post_1 = Post.objects.get(id=self.post_1.pk)
+        self.assertEqual(post_1.rating, 1)
+        self.assertEqual(post_1.show_count, 1)
+        self.assertEqual(post_1.comment_count, 2)
+        self.assertEqual(Comment.objects.get(id=self.comment_1.pk).rating, -1)
+        self.assertEqual(Comment.objects.get(id=self.comment_2.pk).rating, 0)
+
+    def test_comment_delete_decrements_count(self):
+        self.comment_2.delete()
+        self.assertEqual(Post.objects.get(id=self.post_1.pk).comment_count, 1)
+
+    def test_cascade_and_queryset_deletes(self):
+        self.user_2.delete()
+        PostLike.objects.filter(user=self.user_3).delete()
+        post_1 = Post.objects.get(id=self.post_1.pk)
+        self.assertEqual((post_1.rating, post_1.comment_count), (1, 1))
+        self.assertEqual(post_1.hot_score, hot_score(1, post_1.create_at))
+        self.assertEqual(PostScoreBucket.objects.filter(post=self.post_1).aggregate(total=Sum('score'))['total'], 1)
+        self.assertEqual(Comment.objects.get(id=self.comment_1.pk).rating, 0)
+
+        def counters():
+            return (
+                list(Post.objects.values_list('rating', 'comment_count')),
+                list(Comment.objects.values_list('rating')),
+                list(UserStats.objects.filter(user=self.user_1).values_list('posts_likes', 'comments_likes', 'reputation')),
+            )
+
+        expected = counters()
+        self.assertEqual(expected[2][0], (1, 0, 2))
+        call_command('rebuild_counters', stdout=StringIO())
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertEqual(counters(), expected)
+
+    def test_stale_post_save_keeps_counters(self):
+        self.post_1.title = 'title 1 edited'
+        self.post_1.save()
+        post_1 = Post.objects.get(id=self.post_1.pk)
+        self.assertEqual(post_1.title, 'title 1 edited')
+        self.assertEqual(post_1.rating, 1)
+        self.assertEqual(post_1.comment_count, 2)
+
+    def test_rebuild_counters_command(self):
+        Post.objects.update(rating=100, show_count=100, comment_count=100)
+        Comment.objects.update(rating=100)
+        call_command('rebuild_counters', stdout=StringIO())
+        post_1 = Post.objects.get(id=self.post_1.pk)
+        self.assertEqual(post_1.rating, 1)
+        self.assertEqual(post_1.show_count, 1)
+        self.assertEqual(post_1.comment_count, 2)
+        self.assertEqual(Comment.objects.get(id=self.comment_1.pk).rating, -1)
+        self.assertEqual(Comment.objects.get(id=self.comment_2.pk).rating, 0)
+
+
+@override_settings(PYFLOW_PAGE_SIZE=2)
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user_1 = User.objects.create_user(username='user1')
+        self.user_2 = User.objects.create_user(username='user2')
+        self.posts = [
+            Post.objects.create(title=f'title{i}', content=f'content{i}', content_code='code', user=self.user_1)
+            for i in range(5)
+        ]
+        Post.objects.filter(id__in=[self.posts[1].pk, self.posts[2].pk]).update(create_at=self.posts[1].create_at)
+        for i, post in enumerate(self.posts):
+            for user in (self.user_1, self.user_2)[:i % 3]:
+                PostLike.objects.create(value=1, post=post, user=user)
+
+    def walk(self, url, params):
+        response = self.client.get(url, params)
+        pages = [list(response.context['posts'])]
+        while response.context['page'].has_next():
+            response = self.client.get(url + response.context['page'].next_url)
+            pages.append(list(response.context['posts']))
+        back = [list(response.context['posts'])]
+        while response.context['page'].has_previous():
+            response = self.client.get(url + response.context['page'].prev_url)
+            back.insert(0, list(response.context['posts']))
+        self.assertEqual(pages, back)
+        return pages
+
+    def test_view_main_pages(self):
+        pages = self.walk('/', {})
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        expected = list(Post.objects.order_by('-create_at', '-id'))
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_view_sort_by_date_top_pages(self):
+        pages = self.walk('/post/date/', {'button': 'top'})
+        expected = list(Post.objects.order_by('-rating', '-id'))
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([post.rating for post in sum(pages, [])], [2, 1, 1, 0, 0])
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get('/')
+        page = response.context['page']
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertIn('after=', page.next_url)
+
+    def test_invalid_cursor_404(self):
+        response = self.client.get('/', {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+        for url, params in (
+            ('/', {'after': encode_cursor([None, None])}),
+            ('/', {'before': encode_cursor([None, self.posts[0].pk])}),
+            ('/post/date/', {'button': 'top', 'after': encode_cursor([None, 1])}),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 404)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user_1 = User.objects.create_user(username='user1')
+        self.post_1 = Post.objects.create(
+            title='django queryset', content='how to filter', content_code='code', user=self.user_1
+        )
+        self.post_2 = Post.objects.create(
+            title='asyncio loop', content='calling django from a coroutine', content_code='code', user=self.user_1
+        )
+        self.post_3 = Post.objects.create(
+            title='pandas', content='dataframe merge', content_code='code', user=self.user_1
+        )
+
+    def search(self, q, **params):
+        response = self.client.get('/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_fts_index_installed(self):
+        self.assertTrue(fts_available())
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('Django  query-set django'), '"django"* OR "query"* OR "set"*')
+        self.assertEqual(match_expression(' "*) '), '')
+
+    def test_prefix_match_ranked_by_title(self):
+        posts = self.search('djan').context['posts']
+        self.assertIsInstance(posts, QuerySet)
+        self.assertEqual(list(posts), [self.post_1, self.post_2])
+
+    def test_search_follows_edit_and_delete(self):
+        self.post_3.title = 'django pandas'
+        self.post_3.save()
+        self.assertIn(self.post_3, self.search('django').context['posts'])
+        self.post_1.delete()
+        self.assertEqual(list(self.search('django').context['posts']), [self.post_3, self.post_2])
+
+    def test_empty_query(self):
+        self.assertEqual(list(self.search('').context['posts']), [])
+
+    @override_settings(PYFLOW_PAGE_SIZE=1)
+    def test_search_pages(self):
+        response = self.search('django')
+        self.assertEqual(list(response.context['posts']), [self.post_1])
+        response = self.client.get('/search/' + response.context['page'].next_url)
+        self.assertEqual(list(response.context['posts']), [self.post_2])
+        page = response.context['page']
+        self.assertFalse(page.has_next())
+        response = self.client.get('/search/' + page.prev_url)
+        self.assertEqual(list(response.context['posts']), [self.post_1])
+        self.assertFalse(response.context['page'].has_previous())
+
+    def test_install_search_index_restores_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER pyflow_post_fts_ai')
+        post_4 = Post.objects.create(title='django signals', content='content', content_code='code')
+        install_search_index()
+        self.assertIn(post_4, self.search('signals').context['posts'])
+
+
+class TagCountTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.tag_1 = Tag.objects.create(title='tag1')
+        self.tag_2 = Tag.objects.create(title='tag2')
+        self.tag_3 = Tag.objects.create(title='tag3')
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code')
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code')
+
+    def counts(self):
+        return list(Tag.objects.order_by('id').values_list('post_count', flat=True))
+
+    def test_set_add_remove_clear(self):
+        self.post_1.tags.set([self.tag_1, self.tag_2])
+        self.post_2.tags.add(self.tag_1)
+        self.assertEqual(self.counts(), [2, 1, 0])
+        self.post_1.tags.set([self.tag_2, self.tag_3])
+        self.assertEqual(self.counts(), [1, 1, 1])
+        self.post_1.tags.remove(self.tag_2)
+        self.assertEqual(self.counts(), [1, 0, 1])
+        self.post_1.tags.clear()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+    def test_reverse_add_and_clear(self):
+        self.tag_3.posts.add(self.post_1, self.post_2)
+        self.assertEqual(self.counts(), [0, 0, 2])
+        self.tag_3.posts.clear()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_post_delete(self):
+        self.post_1.tags.set([self.tag_1, self.tag_2])
+        self.post_2.tags.set([self.tag_1])
+        self.post_1.delete()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+    def test_popular_tags_cached_and_invalidated(self):
+        self.post_1.tags.set([self.tag_2])
+        self.assertEqual(list(popular_tags()), [self.tag_2, self.tag_1, self.tag_3])
+        with self.assertNumQueries(0):
+            tags = popular_tags()
+            self.assertEqual(list(tags), [self.tag_2, self.tag_1, self.tag_3])
+            self.assertEqual(tags[0].post_count, 1)
+        self.post_2.tags.set([self.tag_3])
+        self.post_1.tags.add(self.tag_3)
+        self.assertEqual(list(popular_tags()), [self.tag_3, self.tag_2, self.tag_1])
+
+    @override_settings(PYFLOW_SIDEBAR_TAGS=2)
+    def test_popular_tags_limit(self):
+        self.assertEqual(len(popular_tags()), 2)
+
+
+class FeedQueryCountTestCase(TestCase):
+    urls = [
+        ('/', {}),
+        ('/post/date/', {'button': 'top'}),
+        ('/post/date/', {'button': 'week'}),
+        ('/search/', {'q': 'title'}),
+    ]
+
+    def setUp(self):
+        self.tag = Tag.objects.create(title='tag')
+        self.created = 0
+
+    def add_posts(self, n):
+        for _ in range(n):
+            self.created += 1
+            user = User.objects.create_user(username=f'user{self.created}')
+            post = Post.objects.create(title=f'title {self.created}', content='content', content_code='code', user=user)
+            post.tags.set([self.tag, Tag.objects.create(title=f'tag{self.created}')])
+            PostLike.objects.create(value=1, post=post, user=user)
+            PostShow.objects.create(post=post, user=user)
+            Comment.objects.create(comment='comment', post=post, user=user)
+
+    def count_queries(self, url, params):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_count_is_constant(self):
+        urls = self.urls + [(f'/post/tag/{self.tag.pk}', {})]
+        self.add_posts(2)
+        small = [self.count_queries(url, params) for url, params in urls]
+        self.add_posts(10)
+        large = [self.count_queries(url, params) for url, params in urls]
+        self.assertEqual(small, large)
+
+
+class RelatedPostsTestCase(TestCase):
+    def setUp(self):
+        self.common = Tag.objects.create(title='python')
+        self.rare = Tag.objects.create(title='asyncio')
+        self.other = Tag.objects.create(title='django')
+        self.post = self.create_post([self.common, self.rare])
+        self.shares_common = self.create_post([self.common])
+        self.shares_rare = self.create_post([self.rare, self.other])
+        self.shares_both = self.create_post([self.common, self.rare])
+        self.unrelated = self.create_post([self.other])
+        for _ in range(5):
+            self.create_post([self.common])
+
+    def create_post(self, tags):
+        post = Post.objects.create(title='title', content='content', content_code='code')
+        post.tags.set(tags)
+        return post
+
+    def test_ranked_by_weighted_overlap(self):
+        posts = related_posts(self.post, limit=3)
+        self.assertIsInstance(posts, QuerySet)
+        self.assertEqual(list(posts)[:2], [self.shares_both, self.shares_rare])
+        self.assertEqual(list(posts[2].tags.all()), [self.common])
+        self.assertNotIn(self.post, posts)
+        self.assertNotIn(self.unrelated, posts)
+        self.assertGreater(posts.get(id=self.shares_rare.pk).score, posts.get(id=posts[2].pk).score)
+
+    def test_bounded_query_count(self):
+        # two lookups for the tag weights, then a single ranking query
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(related_posts(self.post, limit=2))), 2)
+
+    @override_settings(PYFLOW_RELATED_MAX_TAG_POSTS=3)
+    def test_common_tags_skipped(self):
+        self.assertEqual(list(related_posts(self.post)), [self.shares_both, self.shares_rare])
+
+    def test_post_without_tags(self):
+        post = Post.objects.create(title='title', content='content', content_code='code')
+        self.assertEqual(list(related_posts(post)), [])
+
+
+class ShowBufferTestCase(TestCase):
+    def setUp(self):
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.user_1 = User.objects.create_user(username='user1')
+        self.user_2 = User.objects.create_user(username='user2')
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code')
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code')
+        PostShow.objects.create(post=self.post_1, user=self.user_1)
+
+    @override_settings(PYFLOW_SHOW_BUFFER_SIZE=1)
+    def test_failed_flush_keeps_shows(self):
+        self.client.force_login(self.user_2)
+        error = OperationalError('database is locked')
+        with mock.patch.object(ShowBuffer, '_flush_shows', side_effect=error), \
+                self.assertLogs('pyflow.show_buffer', 'ERROR'):
+            self.assertEqual(self.client.get(f'/post/{self.post_1.pk}').status_code, 200)
+            show_buffer.add_anonymous(self.post_1.pk, 'visitor')
+        self.assertEqual(show_buffer.pairs, {(self.post_1.pk, self.user_2.pk)})
+        self.assertEqual(set(show_buffer.sketches), {self.post_1.pk})
+        show_buffer.flush()
+        self.assertTrue(PostShow.objects.filter(post=self.post_1, user=self.user_2).exists())
+        self.assertEqual(Post.objects.get(id=self.post_1.pk).show_count, 2)
+        self.assertEqual(PostViewerSketch.objects.get(post=self.post_1).estimate, 1)
+
+    def test_detail_view_buffers_show(self):
+        self.client.force_login(self.user_2)
+        self.client.get(f'/post/{self.post_1.pk}')
+        self.assertEqual(self.post_1.shows.count(), 1)
+        show_buffer.flush()
+        self.assertEqual(self.post_1.shows.count(), 2)
+        self.assertEqual(Post.objects.get(id=self.post_1.pk).show_count, 2)
+
+    def test_flush_dedupes_in_memory_and_against_db(self):
+        for _ in range(3):
+            show_buffer.add(self.post_1.pk, self.user_1.pk)
+            show_buffer.add(self.post_1.pk, self.user_2.pk)
+            show_buffer.add(self.post_2.pk, self.user_2.pk)
+        # Seven for the shows, seven for creating and filling the series rows.
+        with self.assertNumQueries(14):
+            show_buffer.flush()
+        self.assertEqual(PostShow.objects.filter(post=self.post_1).count(), 2)
+        self.assertEqual(PostShow.objects.filter(post=self.post_2).count(), 1)
+        self.assertEqual(Post.objects.get(id=self.post_1.pk).show_count, 2)
+        self.assertEqual(Post.objects.get(id=self.post_2.pk).show_count, 1)
+
+    def test_flush_skips_deleted_posts(self):
+        show_buffer.add(self.post_2.pk, self.user_1.pk)
+        show_buffer.add_anonymous(self.post_2.pk, 'visitor')
+        self.post_2.delete()
+        show_buffer.flush()
+        self.assertFalse(PostShow.objects.filter(post_id=self.post_2.pk).exists())
+        self.assertFalse(PostViewerSketch.objects.exists())
+
+    @override_settings(PYFLOW_SHOW_BUFFER_SIZE=2)
+    def test_flush_when_full(self):
+        show_buffer.add(self.post_2.pk, self.user_1.pk)
+        self.assertEqual(self.post_2.shows.count(), 0)
+        show_buffer.add(self.post_2.pk, self.user_2.pk)
+        self.assertEqual(self.post_2.shows.count(), 2)
+
+    def test_anonymous_viewers_sketch(self):
+        for i in range(50):
+            show_buffer.add_anonymous(self.post_1.pk, f'visitor{i % 20}')
+        show_buffer.flush()
+        for i in range(10, 40):
+            show_buffer.add_anonymous(self.post_1.pk, f'visitor{i}')
+        show_buffer.flush()
+        self.assertEqual(PostShow.objects.filter(post=self.post_1).count(), 1)
+        self.assertAlmostEqual(PostViewerSketch.objects.get(post=self.post_1).estimate, 40, delta=2)
+        response = self.client.get(f'/post/{self.post_1.pk}')
+        estimate = PostViewerSketch.objects.get().estimate
+        self.assertEqual(response.context['anonymous_viewers'], estimate)
+        # The view count is the signed-in one shown on the feed and in the
+        # API; the estimate is labelled on its own.
+        self.assertNotContains(response, f'{1 + estimate} times')
+        self.assertContains(response, f'about {estimate}')
+
+    def test_hyperloglog_estimate(self):
+        sketch = HyperLogLog()
+        other = HyperLogLog()
+        for i in range(20000):
+            (sketch if i % 2 else other).add(i)
+            sketch.add(i % 1000)
+        sketch.merge(HyperLogLog(other.to_bytes()))
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.1)
+
+
+class FailingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('SMTP is down')
+
+
+class SMTPStandIn(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply('220 localhost')
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while (data := self.rfile.readline()) not in (b'.\r\n', b''):
+                    lines.append(data)
+                self.server.messages.append(b''.join(lines))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('250 localhost' if command.startswith(('EHLO', 'HELO')) else '250 OK')
+
+
+class MailQueueTestCase(TestCase):
+    def setUp(self):
+        for i in range(3):
+            OutboundEmail.objects.create(subject=f'topic{i}', html_message='<p>post</p>', recipient=f'to{i}@example.com')
+
+    def test_send_batch(self):
+        self.assertEqual(send_batch(), (3, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['topic0', 'topic1', 'topic2'])
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+        self.assertEqual(send_batch(), (0, 0))
+
+    @override_settings(PYFLOW_MAIL_BATCH_SIZE=2)
+    def test_batch_size(self):
+        self.assertEqual(send_batch(), (2, 0))
+        self.assertEqual(send_batch(), (1, 0))
+
+    @override_settings(EMAIL_BACKEND='pyflow.tests.FailingBackend', PYFLOW_MAIL_MAX_ATTEMPTS=2)
+    def test_retry_with_backoff_then_fail(self):
+        with self.assertLogs('pyflow.mail_queue', 'WARNING'):
+            self.assertEqual(send_batch(), (0, 3))
+        message = OutboundEmail.objects.get(subject='topic0')
+        self.assertEqual(message.status, OutboundEmail.QUEUED)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('SMTP is down', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(send_batch(), (0, 0))
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('pyflow.mail_queue', 'WARNING'):
+            self.assertEqual(send_batch(), (0, 3))
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.FAILED).count(), 3)
+
+    def test_smtp_connection_reused_across_batch(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStandIn)
+        server.sessions = 0
+        server.messages = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1],
+            EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            self.assertEqual(send_batch(), (3, 0))
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(len(server.messages), 3)
+        self.assertIn(b'Subject: topic1', server.messages[1])
+
+
+class TagsCreatorTestCase(TestCase):
+    def setUp(self):
+        tag_cache.clear()
+        self.addCleanup(tag_cache.clear)
+        self.tag_1 = Tag.objects.create(title='django')
+
+    def test_parse_tags(self):
+        self.assertEqual(parse_tags('#Django #python ##DJANGO #orm'), ['django', 'python', 'orm'])
+
+    def test_existing_tags_single_query(self):
+        with self.assertNumQueries(1):
+            tags = tags_creator('#django')
+        self.assertEqual(tags, [self.tag_1])
+        self.assertEqual(tags[0].title, 'django')
+
+    def test_new_tags_bulk_created(self):
+        with self.assertNumQueries(3):
+            tags = tags_creator('#Django #python #orm')
+        self.assertEqual([tag.title for tag in tags], ['django', 'python', 'orm'])
+        self.assertEqual(tags, list(Tag.objects.filter(title__in=['django', 'python', 'orm']).order_by('id')))
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_cached_tags_skip_db(self):
+        tags_creator('#django #python')
+        with self.assertNumQueries(0):
+            tags = tags_creator('#python #django')
+        post = Post.objects.create(title='title', content='content', content_code='code')
+        post.tags.set(tags)
+        self.assertEqual(sorted(tag.title for tag in post.tags.all()), ['django', 'python'])
+
+    def test_title_unique(self):
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(title='django')
+
+    @override_settings(PYFLOW_TAG_CACHE_SIZE=2)
+    def test_cache_evicts_least_recently_used(self):
+        tags_creator('#a #b')
+        tags_creator('#a')
+        tags_creator('#c')
+        self.assertEqual(list(tag_cache.get_many(['a', 'b', 'c'])), ['a', 'c'])
+
+    def test_deleted_tag_evicted(self):
+        tags_creator('#python')
+        Tag.objects.get(title='python').delete()
+        tags = tags_creator('#python')
+        self.assertTrue(Tag.objects.filter(id=tags[0].pk, title='python').exists())
+
+
+class StaleTagCacheTestCase(TransactionTestCase):
+    # The foreign key is only checked on commit, so this runs outside a
+    # test transaction.
+
+    def setUp(self):
+        tag_cache.clear()
+        self.addCleanup(tag_cache.clear)
+        self.user = User.objects.create_user(username='user1')
+
+    def test_tag_deleted_by_another_process(self):
+        stale = tags_creator('#python')[0]
+        Tag.objects.filter(pk=stale.pk).delete()
+        # Another process's delete leaves this process's cache alone.
+        tag_cache.set_many({'python': stale.pk})
+        self.client.force_login(self.user)
+        response = self.client.post('/post/create/', {
+            'title': 'title', 'content': 'content', 'content_code': 'code', 'tags': '#python #django',
+        })
+        post = Post.objects.get()
+        self.assertRedirects(response, f'/post/{post.pk}', fetch_redirect_response=False)
+        self.assertEqual(sorted(tag.title for tag in post.tags.all()), ['django', 'python'])
+        self.assertNotEqual(post.tags.get(title='python').pk, stale.pk)
+        self.assertEqual(Tag.objects.get(title='python').post_count, 1)
+
+
+class LeaderboardTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(4)]
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code')
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code')
+        self.post_3 = Post.objects.create(title='title3', content='content3', content_code='code')
+        self.vote(self.post_1, 2)
+        self.vote(self.post_2, 3)
+        self.vote(self.post_3, -1)
+        PostScoreBucket.objects.create(post=self.post_1, day=timezone.localdate() - timedelta(days=10), score=5)
+
+    def vote(self, post, n, value=1):
+        for user in self.users[:abs(n)]:
+            PostLike.vote(post.pk, user.pk, value if n > 0 else -value)
+
+    def test_votes_fill_daily_bucket(self):
+        bucket = PostScoreBucket.objects.get(post=self.post_2)
+        self.assertEqual(bucket.day, timezone.localdate())
+        self.assertEqual(bucket.score, 3)
+
+    def test_windows(self):
+        self.assertEqual(top_posts('week'), [(3, self.post_2.pk), (2, self.post_1.pk), (-1, self.post_3.pk)])
+        self.assertEqual(top_posts('month'), [(7, self.post_1.pk), (3, self.post_2.pk), (-1, self.post_3.pk)])
+
+    def test_cached_board_updated_by_votes(self):
+        top_posts('week')
+        # user0 turns their -1 into a +1, so the post gains 5.
+        self.vote(self.post_3, 4)
+        with self.assertNumQueries(0):
+            board = top_posts('week')
+        self.assertEqual(board, [(4, self.post_3.pk), (3, self.post_2.pk), (2, self.post_1.pk)])
+
+    @override_settings(PYFLOW_LEADERBOARD_SIZE=2)
+    def test_board_size(self):
+        self.assertEqual(len(top_posts('week')), 2)
+        self.vote(self.post_3, 4)
+        self.assertEqual(top_posts('week'), [(4, self.post_3.pk), (3, self.post_2.pk)])
+
+    def test_hot_score(self):
+        self.assertGreater(Post.objects.get(id=self.post_2.pk).hot_score, Post.objects.get(id=self.post_3.pk).hot_score)
+        Post.objects.filter(id=self.post_2.pk).update(create_at=timezone.now() - timedelta(days=3))
+        PostLike.objects.create(value=1, post=self.post_2, user=self.users[3])
+        post_4 = Post.objects.create(title='title4', content='content4', content_code='code')
+        response = self.client.get('/post/date/', {'button': 'hot'})
+        self.assertEqual(list(response.context['posts']), [self.post_1, post_4, self.post_3, self.post_2])
+
+    @override_settings(PYFLOW_PAGE_SIZE=2)
+    def test_view_top_month_pages(self):
+        response = self.client.get('/post/date/', {'button': 'top_month'})
+        self.assertEqual(list(response.context['posts']), [self.post_1, self.post_2])
+        response = self.client.get('/post/date/' + response.context['page'].next_url)
+        self.assertEqual(list(response.context['posts']), [self.post_3])
+        response = self.client.get('/post/date/' + response.context['page'].prev_url)
+        self.assertEqual(list(response.context['posts']), [self.post_1, self.post_2])
+
+    def test_view_top_week(self):
+        response = self.client.get('/post/date/', {'button': 'top_week'})
+        self.assertEqual(list(response.context['posts']), [self.post_2, self.post_1, self.post_3])
+
+    def test_prune_score_buckets(self):
+        call_command('prune_score_buckets', '--days', '7', stdout=StringIO())
+        self.assertEqual(PostScoreBucket.objects.count(), 3)
+
+
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.user = User.objects.create_user(username='user1')
+        self.tag = Tag.objects.create(title='python')
+        self.post = Post.objects.create(title='django query', content='content', content_code='code', user=self.user)
+        self.post.tags.set([self.tag])
+        PostLike.objects.create(value=1, post=self.post, user=self.user)
+        PostShow.objects.create(post=self.post, user=self.user)
+        comment = Comment.objects.create(comment='comment', post=self.post, user=self.user)
+        CommentLike.objects.create(value=1, comment=comment, user=self.user)
+
+    def full_scans(self, queries):
+        tables = set(connection.introspection.django_table_names(only_existing=True))
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                for row in cursor.fetchall():
+                    words = row[-1].split()
+                    if words[0] == 'SCAN' and words[1] in tables and 'USING' not in words:
+                        scans.append((row[-1], query['sql']))
+        return scans
+
+    def assertNoFullScans(self, url, method='get', data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        self.assertEqual(self.full_scans(queries.captured_queries), [])
+
+    def test_detects_full_scan(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(Post.objects.filter(content='content'))
+        self.assertEqual(len(self.full_scans(queries.captured_queries)), 1)
+
+    def test_feeds(self):
+        self.assertNoFullScans('/')
+        self.assertNoFullScans(f'/post/tag/{self.tag.pk}')
+        for button in ('top', 'hot', 'top_week', 'top_month', 'week', 'month'):
+            self.assertNoFullScans('/post/date/', data={'button': button})
+        self.assertNoFullScans('/search/', data={'q': 'django'})
+
+    def test_detail(self):
+        self.assertNoFullScans(f'/post/{self.post.pk}')
+        self.client.force_login(self.user)
+        self.assertNoFullScans(f'/post/{self.post.pk}')
+        show_buffer.add(self.post.pk, self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            show_buffer.flush()
+        self.assertEqual(self.full_scans(queries.captured_queries), [])
+
+    def test_writes(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans(f'/post/{self.post.pk}', 'post', {'comment': 'comment'})
+        self.assertNoFullScans(f'/rating/post/{self.post.pk}', 'post', {'button': 'like'})
+        self.assertNoFullScans(f'/rating/comment/{self.post.comments.first().pk}', 'post', {'button': 'like'})
+        self.assertNoFullScans(f'/post/edit/{self.post.pk}')
+        self.assertNoFullScans(
+            f'/post/edit/{self.post.pk}', 'post',
+            {'button': 'save', 'title': 'title', 'content': 'content', 'tags': 'python, django'},
+        )
+
+    def test_accounts(self):
+        self.assertNoFullScans('/accounts/top/')
+        self.client.force_login(self.user)
+        self.assertNoFullScans('/accounts/profile/')
+
+    def test_api(self):
+        self.assertNoFullScans('/api/posts')
+        for sort in ('top', 'hot'):
+            self.assertNoFullScans('/api/posts', data={'sort': sort})
+        self.assertNoFullScans('/api/posts', data={'tag': self.tag.pk})
+        self.assertNoFullScans('/api/posts', data={'ids': f'{self.post.pk},999'})
+        self.assertNoFullScans(f'/api/posts/{self.post.pk}')
+        self.assertNoFullScans(f'/api/posts/{self.post.pk}/comments')
+        self.assertNoFullScans('/api/tags')
+        self.assertNoFullScans(f'/api/users/{self.user.pk}')
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        show_buffer.clear()
+        registry.reset()
+        self.addCleanup(show_buffer.clear)
+        self.addCleanup(registry.reset)
+        self.post = Post.objects.create(title='title1', content='content1', content_code='code')
+
+    def metric(self, text, line):
+        return float(next(row for row in text.splitlines() if row.startswith(line + ' ')).split()[-1])
+
+    def test_view_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/')
+            self.client.get('/')
+        index_queries = len(queries)
+        self.client.get(f'/post/{self.post.pk}')
+        self.client.get('/missing/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE pyflow_request_duration_seconds histogram', text)
+        self.assertEqual(self.metric(text, 'pyflow_request_duration_seconds_count{view="index"}'), 2)
+        self.assertEqual(self.metric(text, 'pyflow_request_duration_seconds_bucket{view="index",le="+Inf"}'), 2)
+        self.assertEqual(self.metric(text, 'pyflow_request_duration_seconds_count{view="detail"}'), 1)
+        self.assertEqual(self.metric(text, 'pyflow_request_duration_seconds_count{view="unresolved"}'), 1)
+        self.assertEqual(self.metric(text, 'pyflow_sql_queries_total{view="index"}'), index_queries)
+        self.assertGreater(self.metric(text, 'pyflow_sql_duration_seconds_total{view="index"}'), 0)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_histogram_buckets(self):
+        metrics = MetricsRegistry((0.1, 1))
+        for latency in (0.05, 0.1, 0.5, 3):
+            metrics.record('index', latency, 1, 0.01)
+        stats = metrics.snapshot()['index']
+        self.assertEqual(stats.buckets, [2, 1, 1])
+        self.assertEqual(stats.requests, 4)
+        self.assertEqual(stats.queries, 4)
+
+    def test_threads_share_registry(self):
+        metrics = MetricsRegistry((0.1,))
+
+        def record():
+            for _ in range(1000):
+                metrics.record('index', 0.01, 2, 0.001)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = metrics.snapshot()['index']
+        self.assertEqual(stats.requests, 4000)
+        self.assertEqual(stats.queries, 8000)
+        self.assertEqual(len(metrics.shards), 4)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+
+class SeedBenchmarkTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        call_command(
+            'seed_data', '--users', '10', '--posts', '40', '--tags', '15', '--likes', '100', '--shows', '150',
+            '--comments', '60', '--comment-likes', '50', stdout=StringIO(),
+        )
+
+    def test_seed_data(self):
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Tag.objects.count(), 15)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertEqual(PostLike.objects.count(), 100)
+        self.assertEqual(PostShow.objects.count(), 150)
+        self.assertEqual(CommentLike.objects.count(), 50)
+        self.assertEqual(sum(Tag.objects.values_list('post_count', flat=True)), Post.tags.through.objects.count())
+        tags = list(Tag.objects.order_by('-post_count').values_list('post_count', flat=True))
+        self.assertGreater(tags[0], 3 * tags[-1])
+        self.assertEqual(
+            sum(Post.objects.values_list('rating', flat=True)),
+            sum(PostLike.objects.values_list('value', flat=True)),
+        )
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_shows', flat=True)),
+            PostShow.objects.count(),
+        )
+        self.assertGreater(Post.objects.filter(create_at__lt=timezone.now() - timedelta(days=7)).count(), 0)
+        self.assertEqual(Post.objects.filter(hot_score=0).count(), 0)
+
+    def test_seed_data_twice(self):
+        call_command('seed_data', '--users', '2', '--posts', '2', '--tags', '2', '--likes', '1', '--shows', '1',
+                     '--comments', '1', '--comment-likes', '1', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 12)
+        self.assertEqual(Tag.objects.count(), 17)
+
+    def test_benchmark_views(self):
+        likes = PostLike.objects.count()
+        output = StringIO()
+        call_command('benchmark_views', '--iterations', '2', '--warmup', '0', stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['iterations'], 2)
+        self.assertEqual(report['rows']['Post'], 40)
+        self.assertIn('GET post-by-date?button=top_week', report['views'])
+        self.assertIn('POST rating/comment', report['views'])
+        for view in report['views'].values():
+            self.assertLess(view['status'], 400)
+            self.assertLessEqual(view['p50_ms'], view['p99_ms'])
+            self.assertLessEqual(view['queries'], view['max_queries'])
+        self.assertGreater(report['views']['GET index']['queries'], 0)
+        self.assertIn('GET post-by-date?button=hot (anonymous)', report['views'])
+        self.assertNotIn('POST detail (anonymous)', report['views'])
+        # The first anonymous request fills the page cache and the second is
+        # served from it.
+        self.assertEqual(report['views']['GET detail (anonymous)']['queries'], 0)
+        self.assertEqual(PostLike.objects.count(), likes)
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.user = User.objects.create_user(username='user1')
+        self.post = Post.objects.create(title='title1', content='content1', content_code='code', user=self.user)
+
+    def version(self):
+        return Post.objects.get(id=self.post.pk).version
+
+    def test_card_served_from_cache_until_version_bump(self):
+        self.assertContains(self.client.get('/'), 'title1')
+        Post.objects.filter(id=self.post.pk).update(title='title2')
+        self.assertContains(self.client.get('/'), 'title1')
+        PostLike.objects.create(value=1, post=self.post, user=self.user)
+        response = self.client.get('/')
+        self.assertContains(response, 'title2')
+        self.assertNotContains(response, 'title1')
+
+    def test_writes_bump_version(self):
+        versions = [self.version()]
+        PostLike.objects.create(value=1, post=self.post, user=self.user)
+        versions.append(self.version())
+        comment = Comment.objects.create(comment='comment', post=self.post, user=self.user)
+        versions.append(self.version())
+        comment.delete()
+        versions.append(self.version())
+        self.post.tags.set(tags_creator('#python'))
+        versions.append(self.version())
+        Tag.objects.get(title='python').posts.clear()
+        versions.append(self.version())
+        show_buffer.add(self.post.pk, self.user.pk)
+        show_buffer.flush()
+        versions.append(self.version())
+        self.post.title = 'title2'
+        self.post.save()
+        versions.append(self.version())
+        self.assertEqual(versions, list(range(8)))
+
+    def test_tag_delete_bumps_version(self):
+        self.post.tags.set(tags_creator('#python'))
+        version = self.version()
+        Tag.objects.get(title='python').delete()
+        self.assertEqual(self.version(), version + 1)
+
+
+class MemoryCappedCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = MemoryCappedLocMemCache('test-capped', {'OPTIONS': {'MAX_BYTES': 1000}})
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def test_evicts_least_recently_used(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, 'x' * 300)
+        self.cache.get('a')
+        self.cache.set('d', 'x' * 300)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd']).keys(), {'a', 'c', 'd'})
+        self.assertLessEqual(self.cache.used_bytes, 1000)
+
+    def test_accounts_for_overwrite_delete_and_clear(self):
+        self.cache.set('a', 'x' * 300)
+        used = self.cache.used_bytes
+        self.cache.set('a', 'x' * 300)
+        self.assertEqual(self.cache.used_bytes, used)
+        self.cache.delete('a')
+        self.assertEqual(self.cache.used_bytes, 0)
+        self.cache.set('a', 1)
+        self.cache.incr('a', 1000000)
+        self.assertEqual(self.cache.used_bytes, len(self.cache._cache[self.cache.make_key('a')]))
+        self.cache.clear()
+        self.assertEqual(self.cache.used_bytes, 0)
+
+    def test_oversized_value_not_stored(self):
+        self.cache.set('a', 'x' * 300)
+        self.cache.set('b', 'x' * 2000)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.user = User.objects.create_user(username='user1')
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code', user=self.user)
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code', user=self.user)
+
+    def test_anonymous_hits_cache(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/')
+        self.assertIsNone(cached.context)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertIn('Cookie', cached['Vary'])
+        self.assertNotIn('csrftoken', cached.cookies)
+
+    def test_gzip(self):
+        response = self.client.get(f'/post/{self.post_1.pk}')
+        cached = self.client.get(f'/post/{self.post_1.pk}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(cached['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(cached.content), response.content)
+
+    def test_conditional_get(self):
+        response = self.client.get('/post/date/', {'button': 'top'})
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(self.client.get('/post/date/', {'button': 'top'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(
+            '/post/date/', {'button': 'top'}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(f'/post/{self.post_1.pk}', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_expire_pages(self):
+        self.client.get('/')
+        self.client.get(f'/post/{self.post_1.pk}')
+        self.client.get(f'/post/{self.post_2.pk}')
+        PostLike.objects.create(value=1, post=self.post_2, user=self.user)
+        self.assertIsNotNone(self.client.get('/').context)
+        self.assertIsNone(self.client.get(f'/post/{self.post_1.pk}').context)
+        response = self.client.get(f'/post/{self.post_2.pk}')
+        self.assertEqual(response.context['post_rating'], 1)
+        comment = Comment.objects.create(comment='comment', post=self.post_2, user=self.user)
+        self.assertContains(self.client.get(f'/post/{self.post_2.pk}'), 'comment')
+        CommentLike.objects.create(value=1, comment=comment, user=self.user)
+        self.assertIsNotNone(self.client.get(f'/post/{self.post_2.pk}').context)
+        self.post_1.tags.set(tags_creator('#python'))
+        self.assertContains(self.client.get(f'/post/{self.post_1.pk}'), 'python')
+
+    def test_authenticated_bypass(self):
+        self.client.get(f'/post/{self.post_1.pk}')
+        self.client.force_login(self.user)
+        response = self.client.get(f'/post/{self.post_1.pk}')
+        self.assertIsNotNone(response.context)
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_cached_detail_counts_anonymous_show(self):
+        self.client.get(f'/post/{self.post_1.pk}')
+        show_buffer.clear()
+        self.client.get(f'/post/{self.post_1.pk}')
+        self.assertIn(self.post_1.pk, show_buffer.sketches)
+
+
+class AsyncViewsTestCase(TransactionTestCase):
+    # Async views run their queries on pool threads with their own
+    # connections, which only see committed rows.
+
+    def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        show_buffer.clear()
+        registry.reset()
+        self.addCleanup(show_buffer.clear)
+        self.addCleanup(registry.reset)
+        self.addCleanup(tag_cache.clear)
+        self.user = User.objects.create_user(username='user1')
+        self.tag = Tag.objects.create(title='tag1')
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code', user=self.user)
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code', user=self.user)
+        self.post_1.tags.add(self.tag)
+        self.post_2.tags.add(self.tag)
+        self.comment = Comment.objects.create(post=self.post_1, user=self.user, comment='comment')
+        CommentLike.objects.create(comment=self.comment, user=self.user, value=1)
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def get_async(self, url):
+        with override_settings(ROOT_URLCONF=urlconf(async_views)):
+            return async_to_sync(self.async_client.get)(url)
+
+    def get_sync(self, url):
+        with override_settings(ROOT_URLCONF=urlconf(views)):
+            return self.client.get(url)
+
+    def test_views_match_sync(self):
+        urls = [
+            '/',
+            f'/post/{self.post_1.pk}',
+            f'/post/tag/{self.tag.pk}',
+            '/post/date/?button=hot',
+            '/post/date/?button=top_week',
+            '/post/date/?button=week',
+        ]
+        self.assertTrue(asyncio.iscoroutinefunction(resolve('/', urlconf=urlconf(async_views)).func))
+        keys = ('posts', 'posts_popular', 'tags', 'post', 'comments', 'posts_by_tags', 'liked_post_by_user',
+                'voted_comment_ids', 'anonymous_viewers')
+        for url in urls:
+            expected, response = self.get_sync(url), self.get_async(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.templates[0].name, expected.templates[0].name, url)
+            for key in keys:
+                if key not in expected.context:
+                    continue
+                value = expected.context[key]
+                if isinstance(value, QuerySet):
+                    self.assertEqual(list(response.context[key]), list(value), (url, key))
+                else:
+                    self.assertEqual(response.context[key], value, (url, key))
+        self.assertIn((self.post_1.pk, self.user.pk), show_buffer.pairs)
+
+    def test_missing_objects(self):
+        self.assertEqual(self.get_async('/post/tag/999').status_code, 404)
+        self.assertEqual(self.get_async('/post/999').status_code, 404)
+
+    def test_detail_post_delegates_to_sync_view(self):
+        with override_settings(ROOT_URLCONF=urlconf(async_views)):
+            response = async_to_sync(self.async_client.post)(
+                f'/post/{self.post_2.pk}', 'comment=async', content_type='application/x-www-form-urlencoded',
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.filter(post=self.post_2, comment='async').exists())
+
+    def test_anonymous_page_cache(self):
+        self.async_client.logout()
+        response = self.get_async('/')
+        self.assertIsNotNone(response.context)
+        cached = self.get_async('/')
+        self.assertIsNone(cached.context)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_metrics_count_pool_queries(self):
+        self.get_async('/')
+        stats = registry.snapshot()['index']
+        self.assertEqual(stats.requests, 1)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.sql_time, 0)
+
+    def test_benchmark_async(self):
+        out = StringIO()
+        call_command('benchmark_async', requests=4, concurrency=2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['requests'], 4)
+        self.assertEqual(
+            set(report['views']),
+            {'GET index', 'GET detail', 'GET post-by-tag', 'GET post-by-date?button=hot'},
+        )
+        for result in report['views'].values():
+            for path in ('wsgi', 'asgi'):
+                self.assertEqual(result[path]['statuses'], [200])
+                self.assertGreater(result[path]['requests_per_sec'], 0)
+                self.assertLessEqual(result[path]['p50_ms'], result[path]['p99_ms'])
+
+
+@override_settings(PYFLOW_API_MAX_IDS=3)
+class ApiTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        tag_cache.clear()
+        self.user_1 = User.objects.create_user(username='user1')
+        self.user_2 = User.objects.create_user(username='user2')
+        self.tag_1 = Tag.objects.create(title='tag1')
+        self.tag_2 = Tag.objects.create(title='tag2')
+        self.posts = [
+            Post.objects.create(title=f'title{i}', content=f'content{i}', content_code='code', user=self.user_1)
+            for i in range(3)
+        ]
+        self.posts[0].tags.add(self.tag_1, self.tag_2)
+        self.posts[1].tags.add(self.tag_1)
+        self.comments = [
+            Comment.objects.create(post=self.posts[0], user=self.user_2, comment=f'comment{i}') for i in range(3)
+        ]
+        UserStats.objects.update_or_create(user=self.user_1, defaults={'reputation': 7})
+
+    def get(self, url, data=None, status=200):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_posts(self):
+        with self.assertNumQueries(3):
+            data = self.get('/api/posts')
+        self.assertEqual([post['id'] for post in data['results']], [post.pk for post in reversed(self.posts)])
+        self.assertIsNone(data['next'])
+        post = data['results'][-1]
+        self.assertEqual(post['title'], 'title0')
+        self.assertEqual(post['user'], {'id': self.user_1.pk, 'username': 'user1'})
+        self.assertEqual(post['tags'], [{'id': self.tag_1.pk, 'title': 'tag1'}, {'id': self.tag_2.pk, 'title': 'tag2'}])
+        self.assertEqual(data['results'][0]['tags'], [])
+
+    def test_cursor_pagination(self):
+        data = self.get('/api/posts', {'limit': 2, 'fields': 'id'})
+        self.assertEqual(data['results'], [{'id': self.posts[2].pk}, {'id': self.posts[1].pk}])
+        data = self.get('/api/posts', {'limit': 2, 'fields': 'id', 'after': data['next']})
+        self.assertEqual(data['results'], [{'id': self.posts[0].pk}])
+        self.assertIsNone(data['next'])
+        data = self.get('/api/posts', {'limit': 2, 'fields': 'id', 'before': data['previous']})
+        self.assertEqual(data['results'], [{'id': self.posts[2].pk}, {'id': self.posts[1].pk}])
+        self.get('/api/posts', {'after': 'broken'}, status=400)
+        self.get('/api/posts', {'after': encode_cursor([None, None])}, status=400)
+        self.get('/api/posts', {'sort': 'top', 'before': encode_cursor([None, self.posts[0].pk])}, status=400)
+        self.get('/api/posts', {'limit': 0}, status=400)
+
+    def test_sort_and_tag_filter(self):
+        Post.objects.filter(pk=self.posts[1].pk).update(rating=5)
+        data = self.get('/api/posts', {'sort': 'top', 'fields': 'id,rating'})
+        self.assertEqual(data['results'][0], {'id': self.posts[1].pk, 'rating': 5})
+        data = self.get('/api/posts', {'tag': self.tag_1.pk, 'fields': 'id'})
+        self.assertEqual(data['results'], [{'id': self.posts[1].pk}, {'id': self.posts[0].pk}])
+        self.get('/api/posts', {'sort': 'random'}, status=400)
+
+    def test_fields_trim_projection(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.get('/api/posts', {'fields': 'title,rating'})
+        queries = [query['sql'] for query in captured]
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"content"', queries[-1])
+        self.assertNotIn('auth_user', queries[-1])
+        self.assertEqual(set(data['results'][0]), {'title', 'rating'})
+        self.get('/api/posts', {'fields': 'title,password'}, status=400)
+
+    def test_multi_get(self):
+        ids = [self.posts[1].pk, 999, self.posts[0].pk]
+        with self.assertNumQueries(2):
+            data = self.get('/api/posts', {'ids': ','.join(map(str, ids))})
+        self.assertEqual([post['id'] for post in data['results']], [self.posts[1].pk, self.posts[0].pk])
+        self.assertEqual(len(data['results'][1]['tags']), 2)
+        self.get('/api/posts', {'ids': '1,2,3,4'}, status=400)
+        self.get('/api/posts', {'ids': '1,x'}, status=400)
+
+    def test_post(self):
+        data = self.get(f'/api/posts/{self.posts[0].pk}', {'fields': 'title,comment_count'})
+        self.assertEqual(data, {'title': 'title0', 'comment_count': 3})
+        self.get('/api/posts/999', status=404)
+        self.assertEqual(self.client.post(f'/api/posts/{self.posts[0].pk}').status_code, 405)
+
+    def test_comments(self):
+        data = self.get(f'/api/posts/{self.posts[0].pk}/comments', {'limit': 2})
+        self.assertEqual([comment['comment'] for comment in data['results']], ['comment0', 'comment1'])
+        self.assertEqual(data['results'][0]['user'], {'id': self.user_2.pk, 'username': 'user2'})
+        data = self.get(f'/api/posts/{self.posts[0].pk}/comments', {'limit': 2, 'after': data['next']})
+        self.assertEqual([comment['id'] for comment in data['results']], [self.comments[2].pk])
+        self.get('/api/posts/999/comments', status=404)
+
+    def test_tags(self):
+        data = self.get('/api/tags')
+        self.assertEqual(data['results'], [
+            {'id': self.tag_1.pk, 'title': 'tag1', 'post_count': 2},
+            {'id': self.tag_2.pk, 'title': 'tag2', 'post_count': 1},
+        ])
+
+    def test_users(self):
+        data = self.get(f'/api/users/{self.user_1.pk}', {'fields': 'username,reputation'})
+        self.assertEqual(data, {'username': 'user1', 'reputation': 7})
+        data = self.get(f'/api/users/{self.user_2.pk}')
+        self.assertEqual(data['posts_likes'], 0)
+        self.assertEqual(data['username'], 'user2')
+        self.assertNotIn('password', data)
+        self.get('/api/users/999', status=404)
+
+
+class ReplicaTestCase(TestCase):
+    def setUp(self):
+        forget_health()
+        self.addCleanup(forget_health)
+        self.user = User.objects.create_user(username='user1')
+        self.post = Post.objects.create(title='title1', content='content1', content_code='code', user=self.user)
+
+    def read_aliases(self, request):
+        aliases = {}
+
+        def view(request):
+            aliases['post'] = router.db_for_read(Post)
+            aliases['session'] = router.db_for_read(Session)
+            aliases['write'] = router.db_for_write(Post)
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return aliases, response
+
+    @override_settings(PYFLOW_REPLICAS=['replica1'])
+    def test_safe_requests_read_from_replica(self):
+        with mock.patch('pyflow.replicas.is_healthy', return_value=True):
+            aliases, response = self.read_aliases(RequestFactory().get('/'))
+        self.assertEqual(aliases, {'post': 'replica1', 'session': 'default', 'write': 'default'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    @override_settings(PYFLOW_REPLICAS=['replica1'], PYFLOW_REPLICA_PIN_SECONDS=30)
+    def test_writes_pin_to_primary(self):
+        with mock.patch('pyflow.replicas.is_healthy', return_value=True):
+            aliases, response = self.read_aliases(RequestFactory().post('/'))
+            self.assertEqual(aliases['post'], 'default')
+            cookie = response.cookies[PIN_COOKIE]
+            self.assertEqual(cookie['max-age'], 30)
+            request = RequestFactory().get('/')
+            request.COOKIES[PIN_COOKIE] = cookie.value
+            self.assertEqual(self.read_aliases(request)[0]['post'], 'default')
+            request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+            self.assertEqual(self.read_aliases(request)[0]['post'], 'replica1')
+            request.COOKIES[PIN_COOKIE] = 'garbage'
+            self.assertEqual(self.read_aliases(request)[0]['post'], 'replica1')
+
+    @override_settings(PYFLOW_REPLICAS=['replica1'])
+    def test_unhealthy_replicas_fall_back_to_primary(self):
+        with mock.patch('pyflow.replicas.is_healthy', return_value=False):
+            aliases, _ = self.read_aliases(RequestFactory().get('/'))
+        self.assertEqual(aliases['post'], 'default')
+
+    @override_settings(PYFLOW_REPLICAS=['default'], PYFLOW_REPLICA_MAX_LAG=60, PYFLOW_REPLICA_CHECK_INTERVAL=60)
+    def test_lag_check(self):
+        self.assertFalse(is_healthy('default'))
+        write_heartbeat()
+        self.assertFalse(is_healthy('default'))
+        forget_health()
+        self.assertTrue(is_healthy('default'))
+        ReplicaHeartbeat.objects.update(written_at=timezone.now() - timedelta(minutes=2))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_healthy('default'))
+        forget_health()
+        self.assertFalse(is_healthy('default'))
+
+    def test_router_migrations(self):
+        with override_settings(PYFLOW_REPLICAS=['replica1']):
+            self.assertFalse(router.allow_migrate('replica1', 'pyflow'))
+            self.assertTrue(router.allow_migrate('default', 'pyflow'))
+
+    def test_sync_replica_without_replicas(self):
+        with self.assertRaisesMessage(CommandError, 'No replicas are configured'):
+            call_command('sync_replica')
+
+
+class ReplicaCopyTestCase(TransactionTestCase):
+    # The backup API waits for open write transactions, so the rows have to
+    # be committed.
+
+    def test_copy_database(self):
+        Post.objects.create(title='title1', content='content1', content_code='code')
+        write_heartbeat()
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'replica.sqlite3')
+            copy_database(connection, name)
+            replica = sqlite3.connect(name)
+            try:
+                titles = replica.execute('SELECT title FROM pyflow_post').fetchall()
+                heartbeats = replica.execute('SELECT COUNT(*) FROM pyflow_replicaheartbeat').fetchone()
+            finally:
+                replica.close()
+        self.assertEqual(titles, [('title1',)])
+        self.assertEqual(heartbeats, (1,))
+
+
+class ReplicaFlushTestCase(TransactionTestCase):
+    # A copy taken before any show stands in for a lagging replica.
+
+    def setUp(self):
+        clear_caches()
+        forget_health()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.addCleanup(forget_health)
+        self.user = User.objects.create_user(username='user1')
+        self.post = Post.objects.create(title='title1', content='content1', content_code='code', user=self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, 'replica.sqlite3')
+        copy_database(connection, name)
+        connections.databases['stale'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+        connections.ensure_defaults('stale')
+        connections.prepare_test_settings('stale')
+        self.addCleanup(connections.databases.pop, 'stale')
+        self.addCleanup(lambda: connections['stale'].close())
+
+    @override_settings(PYFLOW_REPLICAS=['stale'], PYFLOW_SHOW_BUFFER_SIZE=1)
+    def test_flush_reads_from_primary(self):
+        self.client.force_login(self.user)
+        with mock.patch('pyflow.replicas.is_healthy', return_value=True):
+            for _ in range(3):
+                self.assertEqual(self.client.get(f'/post/{self.post.pk}').status_code, 200)
+            for visitor in ('a', 'b'):
+                show_buffer.add_anonymous(self.post.pk, visitor)
+                token = read_alias.set('stale')
+                try:
+                    show_buffer.flush()
+                finally:
+                    read_alias.reset(token)
+        self.assertEqual(PostShow.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).show_count, 1)
+        self.assertEqual(PostViewerSketch.objects.get(post=self.post).estimate, 2)
+        self.assertFalse(PostShow.objects.using('stale').exists())
+
+
+class VoteTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.author = User.objects.create_user(username='author')
+        self.voter = User.objects.create_user(username='voter')
+        self.post = Post.objects.create(title='title1', content='content1', content_code='code', user=self.author)
+        self.comment = Comment.objects.create(comment='comment', post=self.post, user=self.author)
+        self.client.force_login(self.voter)
+
+    def rate(self, obj_type, pk, button):
+        response = self.client.post(f'/rating/{obj_type}/{pk}', {'button': button})
+        self.assertRedirects(response, f'/post/{self.post.pk}', fetch_redirect_response=False)
+
+    def test_repeated_post_votes_keep_one_row(self):
+        self.rate('post', self.post.pk, 'like')
+        version = Post.objects.get(pk=self.post.pk).version
+        self.rate('post', self.post.pk, 'like')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(PostLike.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(post.rating, 1)
+        self.assertEqual(post.version, version)
+        self.assertEqual(PostScoreBucket.objects.get(post=self.post).score, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_likes, 1)
+
+    def test_changed_post_vote_moves_counters_by_delta(self):
+        self.rate('post', self.post.pk, 'like')
+        PostLike.objects.create(value=1, post=self.post, user=self.author)
+        self.rate('post', self.post.pk, 'dislike')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(PostLike.objects.get(post=self.post, user=self.voter).value, -1)
+        self.assertEqual(post.rating, 0)
+        self.assertEqual(post.hot_score, hot_score(0, post.create_at))
+        self.assertEqual(PostScoreBucket.objects.get(post=self.post).score, 0)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_likes, 0)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 0)
+
+    def test_flipped_then_deleted_vote_leaves_no_score(self):
+        self.rate('post', self.post.pk, 'like')
+        days_ago = timezone.localdate() - timedelta(days=10)
+        PostLike.objects.update(score_day=days_ago)
+        PostScoreBucket.objects.update(day=days_ago)
+        self.rate('post', self.post.pk, 'dislike')
+        PostLike.objects.get(post=self.post, user=self.voter).delete()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.rating, 0)
+        self.assertEqual(PostScoreBucket.objects.filter(post=self.post).aggregate(total=Sum('score'))['total'], 0)
+        self.assertEqual([row['total'] for row in window_scores('week')], [0])
+        self.assertEqual([row['total'] for row in window_scores('month')], [0])
+
+    def test_deleting_voted_post(self):
+        self.rate('post', self.post.pk, 'like')
+        self.post.delete()
+        self.assertFalse(PostScoreBucket.objects.exists())
+        connection.check_constraints()
+
+    def test_comment_votes(self):
+        self.rate('comment', self.comment.pk, 'dislike')
+        self.rate('comment', self.comment.pk, 'dislike')
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).rating, -1)
+        self.rate('comment', self.comment.pk, 'like')
+        self.assertEqual(CommentLike.objects.filter(comment=self.comment).count(), 1)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).rating, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).comments_likes, 1)
+
+    def test_unique_votes(self):
+        PostLike.vote(self.post.pk, self.voter.pk, 1)
+        CommentLike.vote(self.comment.pk, self.voter.pk, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PostLike.objects.create(value=1, post=self.post, user=self.voter)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CommentLike.objects.create(value=1, comment=self.comment, user=self.voter)
+
+
+@override_settings(PYFLOW_ROLLUP_DAYS=30)
+class RollupTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(5)]
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code', user=self.author)
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code', user=self.author)
+        self.day = timezone.localdate() - timedelta(days=40)
+        self.old = timezone.now() - timedelta(days=40)
+        for user in self.users:
+            PostShow.objects.create(post=self.post_1, user=user)
+        for user in self.users[:2]:
+            PostShow.objects.create(post=self.post_2, user=user)
+        PostShow.objects.filter(user__in=self.users[:3]).update(create_at=self.old)
+        PostShow.objects.filter(user=self.users[1]).update(create_at=self.old - timedelta(days=1))
+
+    def totals(self):
+        return set(PostShowDaily.objects.values_list('post_id', 'day', 'shows'))
+
+    def test_rollup(self):
+        out = StringIO()
+        call_command('rollup_shows', '--batch-size', '2', stdout=out)
+        self.assertIn('Rolled up 5 shows', out.getvalue())
+        self.assertEqual(self.totals(), {
+            (self.post_1.pk, self.day, 2),
+            (self.post_1.pk, self.day - timedelta(days=1), 1),
+            (self.post_2.pk, self.day, 1),
+            (self.post_2.pk, self.day - timedelta(days=1), 1),
+        })
+        self.assertEqual(PostShow.objects.count(), 2)
+        self.assertFalse(PostShow.objects.filter(create_at__lt=rollup_cutoff()).exists())
+
+    def test_resumes_and_merges(self):
+        self.assertEqual(rollup_shows(batch_size=2, max_batches=1), 2)
+        self.assertEqual(PostShow.objects.count(), 5)
+        self.assertEqual(rollup_shows(batch_size=2), 3)
+        self.assertEqual(rollup_shows(), 0)
+        PostShow.objects.create(post=self.post_1, user=self.author)
+        PostShow.objects.filter(user=self.author).update(create_at=self.old)
+        rollup_shows()
+        self.assertIn((self.post_1.pk, self.day, 3), self.totals())
+
+    def test_rolled_up_viewers_count_once(self):
+        show_buffer.clear()
+        rollup_shows()
+        self.assertFalse(PostShow.objects.filter(post=self.post_1, user=self.users[0]).exists())
+        for user in (self.users[0], self.users[1], self.users[4], self.author):
+            show_buffer.add(self.post_1.pk, user.pk)
+        show_buffer.add(self.post_2.pk, self.users[1].pk)
+        show_buffer.flush()
+        self.assertEqual(Post.objects.get(pk=self.post_1.pk).show_count, 6)
+        self.assertEqual(Post.objects.get(pk=self.post_2.pk).show_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_shows, 8)
+
+    def test_aggregates_read_rollups_and_tail(self):
+        rollup_shows()
+        Post.objects.update(show_count=0)
+        UserStats.objects.update(posts_shows=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        call_command('rebuild_user_stats', stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=self.post_1.pk).show_count, 5)
+        self.assertEqual(Post.objects.get(pk=self.post_2.pk).show_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_shows, 7)
+
+
+class SeriesTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        show_buffer.clear()
+        self.addCleanup(show_buffer.clear)
+        self.author = User.objects.create_user(username='author')
+        self.voter = User.objects.create_user(username='voter')
+        self.post_1 = Post.objects.create(title='title1', content='content1', content_code='code', user=self.author)
+        self.post_2 = Post.objects.create(title='title2', content='content2', content_code='code', user=self.author)
+        self.now = dt(2026, 1, 10, 12, 30, tzinfo=pytz.UTC)
+
+    def test_ring_buffers(self):
+        record_series({self.post_1.pk: 2}, 'shows', now=self.now - timedelta(hours=2))
+        record_series({self.post_1.pk: 3, self.post_2.pk: 1}, 'shows', now=self.now)
+        record_series({self.post_1.pk: -1}, 'votes', now=self.now)
+        series = post_series(self.post_1.pk, now=self.now)
+        self.assertEqual(series['hourly']['shows'][-3:], [2, 0, 3])
+        self.assertEqual(series['hourly']['votes'][-1], -1)
+        self.assertEqual(series['hourly']['start'], '2026-01-08T13:00:00+00:00')
+        self.assertEqual(series['daily']['shows'][-1], 5)
+        self.assertEqual(series['daily']['start'], '2025-12-12')
+        self.assertEqual(len(series['hourly']['shows']), settings.PYFLOW_SERIES_HOURS)
+        # A lap later every old slot reads as zero, whether or not it was
+        # overwritten yet.
+        later = self.now + timedelta(hours=settings.PYFLOW_SERIES_HOURS + 1)
+        record_series({self.post_1.pk: 4}, 'shows', now=later)
+        self.assertEqual(sum(post_series(self.post_1.pk, now=later)['hourly']['shows']), 4)
+        self.assertEqual(sum(post_series(self.post_2.pk, now=later)['hourly']['shows']), 0)
+
+    def test_filled_from_write_paths(self):
+        show_buffer.add(self.post_1.pk, self.voter.pk)
+        show_buffer.add(self.post_1.pk, self.voter.pk)
+        show_buffer.add_anonymous(self.post_1.pk, 'visitor')
+        show_buffer.flush()
+        show_buffer.add(self.post_1.pk, self.voter.pk)
+        show_buffer.flush()
+        PostLike.vote(self.post_1.pk, self.voter.pk, 1)
+        series = post_series(self.post_1.pk)
+        self.assertEqual(series['hourly']['shows'][-1], 2)
+        self.assertEqual(series['hourly']['votes'][-1], 1)
+        self.assertEqual(series['daily']['votes'][-1], 1)
+
+    def test_trending(self):
+        for hours in range(2, 26):
+            record_series({self.post_1.pk: 10}, 'shows', now=self.now - timedelta(hours=hours))
+        record_series({self.post_1.pk: 10, self.post_2.pk: 10}, 'shows', now=self.now)
+        record_series({self.post_2.pk: 2}, 'votes', now=self.now)
+        post_3 = Post.objects.create(title='title3', content='content3', content_code='code', user=self.author)
+        record_series({post_3.pk: 50}, 'shows', now=self.now - timedelta(hours=3))
+        with self.assertNumQueries(1):
+            board = trending(now=self.now)
+        self.assertEqual([entry['post_id'] for entry in board], [self.post_2.pk, self.post_1.pk])
+        self.assertEqual(board[0]['recent'], 20)
+        self.assertAlmostEqual(board[1]['growth'], 11 / 11)
+
+    def test_api(self):
+        record_series({self.post_1.pk: 5}, 'shows')
+        response = self.client.get(f'/api/posts/{self.post_1.pk}/series')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['hourly']['shows'][-1], 5)
+        self.assertEqual(self.client.get('/api/posts/0/series').status_code, 404)
+        response = self.client.get('/api/posts/trending')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['post'] for entry in response.json()['results']], [
+            {'id': self.post_1.pk, 'title': 'title1'},
+        ])
+
+
+class TieredCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = TieredCache('test-tiered', {
+            'TIMEOUT': 60,
+            'OPTIONS': {'SHARED': 'shared', 'LOCK_TIMEOUT': 2, 'POLL_INTERVAL': 0.01},
+        })
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def test_tiers(self):
+        self.cache.set('a', 1)
+        self.cache.shared.delete('a')
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.local.clear()
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.shared.set('b', (None, 2))
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(self.cache.local.get('b'), (None, 2))
+        self.assertTrue(self.cache.add('c', 1))
+        self.assertFalse(self.cache.add('c', 2))
+        self.assertEqual(self.cache.incr('c', 5), 6)
+        self.assertEqual(self.cache.get_many(['b', 'c', 'd']), {'b': 2, 'c': 6})
+        self.cache.delete('c')
+        self.assertFalse(self.cache.has_key('c'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('c')
+
+    def test_serves_stale_while_refreshing(self):
+        self.cache.shared.set('k', (time.time() - 1, 'old'))
+        self.assertIsNone(self.cache.get('k'))
+        flight = self.cache._begin('k', None)
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'new'), 'old')
+        self.cache._end('k', None, flight)
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'new'), 'new')
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'newer'), 'new')
+
+    def test_single_flight_across_threads(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        def worker():
+            barrier.wait()
+            return self.cache.get_or_set('cold', compute)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: worker(), range(8)))
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_other_process(self):
+        self.cache.shared.add('cold:flight', 1, 2)
+
+        def other_process():
+            time.sleep(0.05)
+            self.cache.shared.set('cold', (time.time() + 60, 'theirs'))
+            self.cache.shared.delete('cold:flight')
+
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        self.assertEqual(self.cache.get_or_set('cold', lambda: 'ours'), 'theirs')
+        thread.join()
+
+
+class SharedFileCacheTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SharedFileCache(directory.name, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+
+    def test_add_is_atomic(self):
+        barrier = threading.Barrier(8)
+
+        def worker(value):
+            barrier.wait()
+            return self.cache.add('lock', value)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(worker, range(8)))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(self.cache.get('lock'), results.index(True))
+        self.assertEqual(os.listdir(self.cache._dir), [os.path.basename(self.cache._key_to_file('lock'))])
+
+    def test_add_replaces_expired_entry(self):
+        self.cache.set('a', 1, timeout=-1)
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertFalse(self.cache.add('a', 3))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_culls_at_most_once_per_interval(self):
+        with mock.patch.object(SharedFileCache, '_list_cache_files', wraps=self.cache._list_cache_files) as listed:
+            for key in range(6):
+                self.cache.set(key, key)
+        self.assertEqual(listed.call_count, 1)
+
+
+class TagIndexTestCase(TestCase):
+    def setUp(self):
+        tag_cache.clear()
+        tag_index.clear()
+        self.addCleanup(tag_index.clear)
+        for title, post_count in (('python', 5), ('pytest', 9), ('pandas', 1), ('py', 0), ('django', 7)):
+            Tag.objects.create(title=title, post_count=post_count)
+
+    def titles(self, prefix, limit=10):
+        return [tag['title'] for tag in tag_index.complete(prefix, limit)]
+
+    def test_ranked_prefix_matches(self):
+        self.assertEqual(self.titles('py'), ['pytest', 'python', 'py'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('#PYT'), ['pytest', 'python'])
+            self.assertEqual(self.titles('p', limit=2), ['pytest', 'python'])
+            self.assertEqual(self.titles('pythonic'), [])
+            self.assertEqual(self.titles(''), [])
+        self.assertEqual(tag_index.complete('dj', 10), [
+            {'id': Tag.objects.get(title='django').pk, 'title': 'django', 'post_count': 7},
+        ])
+
+    def test_incremental_updates(self):
+        self.titles('py')
+        tags_creator('#pyramid #python')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('py'), ['pytest', 'python', 'py', 'pyramid'])
+        Tag.objects.get(title='pytest').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('pyt'), ['python'])
+
+    def test_reloads_after_refresh_interval(self):
+        self.titles('py')
+        Tag.objects.create(title='pyflow', post_count=100)
+        self.assertNotIn('pyflow', self.titles('py'))
+        with override_settings(PYFLOW_TAG_INDEX_REFRESH=0):
+            self.assertEqual(self.titles('py')[0], 'pyflow')
+
+    def test_api(self):
+        response = self.client.get('/api/tags/autocomplete', {'q': 'py', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tag['title'] for tag in response.json()['results']], ['pytest'])
+        self.assertEqual(self.client.get('/api/tags/autocomplete', {'limit': 0}).status_code, 400)
+
+    def test_form_hook(self):
+        self.client.force_login(User.objects.create_user(username='author'))
+        self.assertContains(self.client.get('/post/create/'), 'data-autocomplete="/api/tags/autocomplete"')
@@ -1,19 +1,34 @@
+from django.conf import settings
 from django.urls import path
 
-from pyflow.views import view_main, \
-    view_detail, view_add_like_or_dislike_value, view_create_post, \
-    view_edit_delete_post, view_delete_comment, view_sort_by_tag, \
-    view_sort_by_date, view_send_post_by_email, view_search_posts
+from pyflow import api, async_views, views
+from pyflow.views import view_add_like_or_dislike_value, view_create_post, \
+    view_edit_delete_post, view_delete_comment, view_send_post_by_email, \
+    view_search_posts, view_metrics
 
-urlpatterns = [
-    path('', view_main, name='index'),
-    path('post/<int:pk>', view_detail, name='detail'),
-    path('post/create/', view_create_post, name='create-post'),
-    path('post/edit/<int:pk>', view_edit_delete_post, name='edit-delete-post'),
-    path('post/tag/<int:pk>', view_sort_by_tag, name='post-by-tag'),
-    path('post/date/', view_sort_by_date, name='post-by-date'),
-    path('comment/delete/<int:pk>', view_delete_comment, name='delete-comment'),
-    path('rating/<obj_type>/<int:pk>', view_add_like_or_dislike_value, name='rating'),
-    path('send_post/<int:pk>', view_send_post_by_email, name='send-post'),
-    path('search/', view_search_posts, name='search-posts'),
-]
+
+def patterns(read_views):
+    return [
+        path('', read_views.view_main, name='index'),
+        path('post/<int:pk>', read_views.view_detail, name='detail'),
+        path('post/create/', view_create_post, name='create-post'),
+        path('post/edit/<int:pk>', view_edit_delete_post, name='edit-delete-post'),
+        path('post/tag/<int:pk>', read_views.view_sort_by_tag, name='post-by-tag'),
+        path('post/date/', read_views.view_sort_by_date, name='post-by-date'),
+        path('comment/delete/<int:pk>', view_delete_comment, name='delete-comment'),
+        path('rating/<obj_type>/<int:pk>', view_add_like_or_dislike_value, name='rating'),
+        path('send_post/<int:pk>', view_send_post_by_email, name='send-post'),
+        path('search/', view_search_posts, name='search-posts'),
+        path('metrics', view_metrics, name='metrics'),
+        path('api/posts', api.api_posts, name='api-posts'),
+        path('api/posts/<int:pk>', api.api_post, name='api-post'),
+        path('api/posts/<int:pk>/comments', api.api_post_comments, name='api-post-comments'),
+        path('api/posts/<int:pk>/series', api.api_post_series, name='api-post-series'),
+        path('api/posts/trending', api.api_trending, name='api-trending'),
+        path('api/tags', api.api_tags, name='api-tags'),
+        path('api/tags/autocomplete', api.api_tag_autocomplete, name='api-tag-autocomplete'),
+        path('api/users/<int:pk>', api.api_user, name='api-user'),
+    ]
+
+
+urlpatterns = patterns(async_views if settings.PYFLOW_ASYNC_VIEWS else views)
@@ -1,91 +1,115 @@
-from django.core.mail import send_mail
-from django.db.models import Sum, Count, F, Q
+from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from datetime import datetime as dt, timedelta
 import pytz
 
-from django.template import loader
-
+from pyflow.feed import feed_queryset
 from pyflow.forms import CommentForm, PostForm, SendEmailForm
-from pyflow.models import Post, Comment, CommentLike, PostLike, Tag, PostShow
-from pyflow.tags_creator import tags_creator, tags_to_string
-from src import settings
+from pyflow.leaderboards import LeaderboardPaginator
+from pyflow.mail_queue import enqueue_post_email
+from pyflow.metrics import render_metrics
+from pyflow.models import Post, Comment, CommentLike, PostLike, Tag, PostViewerSketch
+from pyflow.page_cache import anonymous_page_cache
+from pyflow.pagination import paginate, paginate_with
+from pyflow.related import related_posts
+from pyflow.search import SearchPaginator
+from pyflow.show_buffer import show_buffer, visitor_key
+from pyflow.sidebar import popular_tags
+from pyflow.tags_creator import set_post_tags, tags_to_string
+
 
+FEED_ORDERING = ('-create_at', '-id')
+TOP_ORDERING = ('-rating', '-id')
+HOT_ORDERING = ('-hot_score', '-id')
 
+
+@anonymous_page_cache()
 def view_main(request):
     posts = Post.objects.filter()
-    tags = Tag.objects.filter()
+    page = paginate(request, feed_queryset(posts), FEED_ORDERING)
     context = {
-        'posts': posts.annotate(rating=Sum(F('likes__value'))).order_by('-create_at'),
-        'posts_popular': posts.annotate(shows_count=Count(F('shows'))).order_by('-shows_count')[:5],
-        'tags': tags.annotate(tag_posts=Count(F('posts'))).order_by('-tag_posts'),
+        'posts': page.object_list,
+        'page': page,
+        'posts_popular': posts.order_by('-show_count')[:5],
+        'tags': popular_tags(),
     }
     return render(request, 'index.html', context)
 
 
+@anonymous_page_cache()
 def view_sort_by_tag(request, pk):
     tag = get_object_or_404(Tag, id=pk)
-    posts = Post.objects.filter(tags=tag)
-    tags = Tag.objects.filter()
+    posts = feed_queryset(Post.objects.filter(tags=tag))
+    page = paginate(request, posts, FEED_ORDERING)
     context = {
-        'posts': posts.annotate(rating=Sum(F('likes__value'))).order_by('-create_at'),
-        'tags': tags.annotate(tag_posts=Count(F('posts'))).order_by('-tag_posts'),
+        'posts': page.object_list,
+        'page': page,
+        'tags': popular_tags(),
     }
     return render(request, 'posts_content.html', context)
 
 
+@anonymous_page_cache()
 def view_sort_by_date(request):
     if request.method == 'GET':
         button = request.GET['button']
-        posts = Post.objects.filter()
+        posts = feed_queryset()
         time = dt.now(tz=pytz.UTC)
         if button == 'week':
             time = time - timedelta(7)
         if button == 'month':
             time = time - timedelta(30)
-        posts_sorted = posts.filter(create_at__gt=time).annotate(rating=Sum(F('likes__value'))).order_by('-create_at')
         if button == 'top':
-            posts_sorted = posts.annotate(rating=Sum(F('likes__value'))).order_by(F('rating').desc())
-        tags = Tag.objects.filter()
+            page = paginate(request, posts, TOP_ORDERING)
+        elif button == 'hot':
+            page = paginate(request, posts, HOT_ORDERING)
+        elif button in ('top_week', 'top_month'):
+            page = paginate_with(request, LeaderboardPaginator(button[len('top_'):], posts))
+        else:
+            page = paginate(request, posts.filter(create_at__gt=time), FEED_ORDERING)
         context = {
-            'posts': posts_sorted,
-            'tags': tags.annotate(tag_posts=Count(F('posts'))).order_by('-tag_posts'),
+            'posts': page.object_list,
+            'page': page,
+            'tags': popular_tags(),
         }
         return render(request, 'posts_content.html', context)
 
 
+def count_anonymous_show(request, pk):
+    show_buffer.add_anonymous(pk, visitor_key(request))
+
+
+@anonymous_page_cache(post_kwarg='pk', on_hit=count_anonymous_show)
 def view_detail(request, pk):
-    post = get_object_or_404(Post, id=pk)
-    tags = post.tags.all()
+    post = get_object_or_404(Post.objects.select_related('viewer_sketch'), id=pk)
     if request.method == 'GET':
         comments = post.comments
-        rating = post.likes.aggregate(Sum('value'))['value__sum']
-        posts = Post.objects.exclude(id=post.pk).filter(tags=tags.first())
-        for tag in tags:
-            if posts_sort := posts.filter(tags=tag):
-                posts = posts_sort
-            else:
-                break
+        try:
+            anonymous_viewers = post.viewer_sketch.estimate
+        except PostViewerSketch.DoesNotExist:
+            anonymous_viewers = 0
         context = {
             'post': post,
-            'post_rating': rating if rating else 0,
-            'comments': comments.annotate(rating=Sum(F('likes__value'))).order_by('create_at'),
+            'post_rating': post.rating,
+            'comments': comments.select_related('user').order_by('create_at'),
             'form': CommentForm(),
-            'posts_by_tags': posts,
+            'posts_by_tags': related_posts(post),
             'liked_post_by_user': False,
+            'anonymous_viewers': anonymous_viewers,
         }
         if comment_error := request.session.get('errors'):
             context['errors'] = comment_error['comment']
         if request.user.is_authenticated:
             user = request.user
-            if post.likes.filter(user=user):
+            if post.likes.filter(user=user).exists():
                 context['liked_post_by_user'] = True
-            context['comment_add_or_comment_like_by_user'] = list(comments.filter(user=user))
-            for comment in comments.all():
-                if comment.likes.filter(user=user):
-                    context['comment_add_or_comment_like_by_user'].append(comment)
-            if not post.shows.filter(user=user):
-                PostShow.objects.create(post=post, user=user)
+            context['voted_comment_ids'] = set(
+                comments.filter(Q(user=user) | Q(likes__user=user)).values_list('id', flat=True)
+            )
+            show_buffer.add(post.pk, user.pk)
+        else:
+            count_anonymous_show(request, post.pk)
         return render(request, 'detail.html', context)
     if request.method == 'POST':
         if request.user.is_authenticated:
@@ -119,7 +143,7 @@ def view_create_post(request):
                     'user': user,
                 }
                 post = Post.objects.create(**data)
-                post.tags.set(tags_creator(cd['tags']))
+                set_post_tags(post, cd['tags'])
                 post.save()
                 return redirect('detail', post.pk)
             context = {'form': form}
@@ -136,20 +160,10 @@ def view_add_like_or_dislike_value(request, obj_type, pk):
             value = 1 if button == 'like' else -1
             if obj_type == 'comment':
                 comment = get_object_or_404(Comment, id=pk)
-                data = {
-                    'value': value,
-                    'comment': comment,
-                    'user': user,
-                }
-                CommentLike.objects.create(**data)
-                post_pk = comment.post.pk
+                CommentLike.vote(comment.pk, user.pk, value)
+                post_pk = comment.post_id
             if obj_type == 'post':
-                data = {
-                    'value': value,
-                    'post': get_object_or_404(Post, id=post_pk),
-                    'user': user,
-                }
-                PostLike.objects.create(**data)
+                PostLike.vote(get_object_or_404(Post, id=post_pk).pk, user.pk, value)
             return redirect('detail', post_pk)
         if request.method == 'GET':
             return redirect('index')
@@ -178,7 +192,7 @@ def view_edit_delete_post(request, pk):
                     post.title = cd['title']
                     post.content = cd['content']
                     post.content_code = cd['content_code']
-                    post.tags.set(tags_creator(cd['tags']))
+                    set_post_tags(post, cd['tags'])
                     post.save()
                     return redirect('detail', post.pk)
                 context = {
@@ -214,17 +228,7 @@ def view_send_post_by_email(request, pk):
             form = SendEmailForm(request.POST)
             if form.is_valid():
                 cd = form.cleaned_data
-                html_message = loader.render_to_string(
-                    'email.html', {'post': post},
-                )
-                send_mail(
-                    subject=cd['topic'],
-                    message='',
-                    html_message=html_message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[cd['receiver']],
-                    fail_silently=False,
-                )
+                enqueue_post_email(post, cd['topic'], cd['receiver'])
                 return redirect('detail', pk)
             context = {
                 'form': form,
@@ -236,15 +240,15 @@ def view_send_post_by_email(request, pk):
 
 def view_search_posts(request):
     if request.method == 'GET':
-        key_words = request.GET.get('q').strip().split(' ')
-        posts = Post.objects.filter()
-        posts_query = Post.objects.none()
-        for kw in key_words:
-            posts_query |= posts.filter(Q(title__icontains=kw) | Q(content__icontains=kw))
-        tags = Tag.objects.filter()
+        page = paginate_with(request, SearchPaginator(request.GET.get('q', '')))
         context = {
-            'posts': posts_query.annotate(rating=Sum(F('likes__value'))).order_by('-create_at'),
-            'tags': tags.annotate(tag_posts=Count(F('posts'))).order_by('-tag_posts'),
+            'posts': page.object_list,
+            'page': page,
+            'tags': popular_tags(),
         }
         return render(request, 'posts_content.html', context)
     return redirect('index')
+
+
+def view_metrics(request):
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
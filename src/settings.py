@@ -41,11 +41,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_extensions',
-    'pyflow',
-    'accounts',
+    'pyflow.apps.PyflowConfig',
+    'accounts.apps.AccountsConfig',
 ]
 
 MIDDLEWARE = [
+    'pyflow.metrics.MetricsMiddleware',
+    'pyflow.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +92,55 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. PYFLOW_READ_REPLICAS=db.replica.sqlite3 for a local copy
+# kept current with `manage.py sync_replica`.
+for number, name in enumerate(filter(None, os.getenv('PYFLOW_READ_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['pyflow.replicas.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/ref/settings/#caches
+
+# The default cache keeps recent entries in process and shares the rest
+# through files every process on the host reads.
+CACHES = {
+    'default': {
+        'BACKEND': 'pyflow.cache_backends.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'STALE_TIMEOUT': 30,
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    'shared': {
+        'BACKEND': 'pyflow.cache_backends.SharedFileCache',
+        'LOCATION': os.getenv('PYFLOW_CACHE_DIR', '/var/tmp/pyflow-cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_INTERVAL': 60,
+        },
+    },
+    'fragments': {
+        'BACKEND': 'pyflow.cache_backends.MemoryCappedLocMemCache',
+        'LOCATION': 'pyflow-fragments',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_BYTES': 32 * 1024 * 1024,
+        },
+    },
+}
+
+# Tests keep the shared tier in memory; see pyflow.test_runner.
+TEST_RUNNER = 'pyflow.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -139,3 +190,38 @@ EMAIL_USE_SSL = True
 
 LOGIN_REDIRECT_URL = 'profile'
 LOGOUT_REDIRECT_URL = 'index'
+
+PYFLOW_PAGE_SIZE = 20
+PYFLOW_SIDEBAR_TAGS = 50
+PYFLOW_SIDEBAR_TIMEOUT = 60 * 60
+PYFLOW_RELATED_POSTS = 5
+PYFLOW_RELATED_MAX_TAG_POSTS = 10000
+PYFLOW_SHOW_BUFFER_SIZE = 500
+PYFLOW_SHOW_FLUSH_INTERVAL = 10
+PYFLOW_MAIL_BATCH_SIZE = 50
+PYFLOW_MAIL_MAX_ATTEMPTS = 5
+PYFLOW_MAIL_RETRY_DELAY = 30
+PYFLOW_MAIL_MAX_RETRY_DELAY = 60 * 60
+PYFLOW_MAIL_LEASE = 5 * 60
+PYFLOW_TAG_CACHE_SIZE = 10000
+PYFLOW_LEADERBOARD_SIZE = 100
+PYFLOW_LEADERBOARD_TIMEOUT = 10 * 60
+PYFLOW_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+PYFLOW_PAGE_CACHE_TIMEOUT = 60
+PYFLOW_ASYNC_VIEWS = os.getenv('PYFLOW_ASYNC_VIEWS') == '1'
+PYFLOW_ASYNC_QUERY_WORKERS = 8
+PYFLOW_API_MAX_LIMIT = 100
+PYFLOW_API_MAX_IDS = 100
+PYFLOW_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+PYFLOW_REPLICA_PIN_SECONDS = 10
+PYFLOW_REPLICA_MAX_LAG = 60
+PYFLOW_REPLICA_CHECK_INTERVAL = 5
+PYFLOW_ROLLUP_DAYS = 30
+PYFLOW_ROLLUP_BATCH_SIZE = 1000
+PYFLOW_SERIES_HOURS = 48
+PYFLOW_SERIES_DAYS = 30
+PYFLOW_TRENDING_BASELINE_HOURS = 24
+PYFLOW_TRENDING_MIN_ACTIVITY = 3
+PYFLOW_TRENDING_SIZE = 100
+PYFLOW_TRENDING_TIMEOUT = 60
+PYFLOW_TAG_INDEX_REFRESH = 5 * 60